@@ -0,0 +1,88 @@
+"""Measures the time needed to import the bot with ``python -X importtime``.
+
+    python -m benchmarks.import_time --max-ms 300
+
+It prints a JSON report with the total import time, the slowest modules and
+whether heavy optional modules (pandas, numpy) were loaded.  The exit code is
+1 if the total exceeds --max-ms or a heavy module is imported, so it can
+track regressions between commits.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+TARGETS = ['xerta_bot.commands', 'xerta_bot.wrappers', 'run']
+HEAVY_MODULES = ['pandas', 'numpy', 'sqlite3']
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def import_times(module):
+    """Runs a fresh interpreter that imports module.
+
+    Returns
+    -------
+    times: dict
+        Cumulative import time in microseconds of every imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True
+    )
+    if(result.returncode != 0):
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if(not line.startswith('import time:') or 'cumulative' in line):
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def report(module, top=10):
+    times = import_times(module)
+
+    slowest = sorted(times.items(), key=lambda item: -item[1])[:top]
+    heavy = [name for name in HEAVY_MODULES if name in times]
+
+    return {
+        'module': module,
+        'total_ms': times.get(module, 0) / 1e3,
+        'modules': len(times),
+        'heavy_modules': heavy,
+        'slowest_ms': {name: t / 1e3 for name, t in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=TARGETS)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if a module takes longer to import')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='keep the fastest of several runs')
+    args = parser.parse_args()
+
+    reports = []
+    for module in args.modules:
+        runs = [report(module) for _ in range(args.repeat)]
+        reports.append(min(runs, key=lambda r: r['total_ms']))
+
+    print(json.dumps(reports, indent=4))
+
+    failed = any(
+        r['heavy_modules'] or (args.max_ms is not None and r['total_ms'] > args.max_ms)
+        for r in reports
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Measures the latency of ``random_joke`` for growing jokes tables.
+
+The benchmark fills the jokes table of the database configured through the
+MYSQL_* environment variables, so point it to a scratch database:
+
+    MYSQL_DATABASE=xerta_bot_bench python -m benchmarks.joke_latency
+
+Every row of the jokes table is deleted when the benchmark finishes.
+"""
+import statistics
+import time
+
+# package imports
+from xerta_bot.database import manager
+from xerta_bot.database.managers import jokes
+
+
+SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+SAMPLES = 1_000
+BATCH = 10_000
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def fill_jokes(conn, start, stop):
+    """Inserts synthetic jokes with numbers in [start, stop)."""
+    cursor = conn.cursor()
+    for i in range(start, stop, BATCH):
+        rows = [(f'benchmark joke number {j}',)
+                for j in range(i, min(i + BATCH, stop))]
+        cursor.executemany('INSERT INTO jokes (joke) VALUES (%s)', rows)
+    conn.commit()
+    cursor.close()
+
+
+def time_random_joke(conn):
+    """Returns the median and p99 latency of random_joke in milliseconds."""
+    latencies = []
+    for _ in range(SAMPLES):
+        t0 = time.perf_counter()
+        jokes.random_joke(conn)
+        latencies.append((time.perf_counter() - t0) * 1e3)
+
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(0.99 * SAMPLES)]
+
+
+def main():
+    with manager.connection() as conn:
+        manager.reset_table(conn, 'jokes')
+
+        try:
+            size = 0
+            print(f'{"jokes":>10} {"refresh ms":>11} {"p50 ms":>8} {"p99 ms":>8}')
+            for target in SIZES:
+                fill_jokes(conn, size, target)
+                size = target
+
+                t0 = time.perf_counter()
+                jokes.refresh_joke_ids(conn)
+                refresh = (time.perf_counter() - t0) * 1e3
+
+                p50, p99 = time_random_joke(conn)
+                print(f'{size:>10} {refresh:>11.2f} {p50:>8.3f} {p99:>8.3f}')
+        finally:
+            manager.reset_table(conn, 'jokes')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""End-to-end benchmark of the handler pipeline with synthetic updates.
+
+Every handler of xerta_bot.commands is called with fake Update and Context
+objects, through the same decorators used in production, against an
+embedded SQLite database filled with synthetic users, jokes and command
+history:
+
+    python -m benchmarks.pipeline --users 100,10000 --jokes 1000,100000 \\
+        --history 10000 --output results.json
+
+Each scenario runs in a fresh interpreter.  For every handler it reports
+the latency percentiles, the database statements per update and the memory
+allocated per update, as JSON, so results can be compared between commits.
+Rate limits are lifted during the benchmark so every update reaches the
+database.
+"""
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+
+HANDLERS = ['start', 'joke', 'joke_search', 'message', 'users', 'users_page', 'stats']
+COMMANDS = ['start', 'joke', 'message', 'users', 'stats']  # in the history
+ADMINS = 100  # users with privilege 2
+
+
+# --------------------------------------------------------------------------------
+# synthetic telegram objects
+# --------------------------------------------------------------------------------
+class FakeMessage:
+    def __init__(self, user, chat, text):
+        self.from_user = user
+        self.chat = chat
+        self.text = text
+        self.replies = []
+
+    def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, user, message, data):
+        self.from_user = user
+        self.message = message
+        self.data = data
+
+    def answer(self, *args, **kwargs):
+        pass
+
+    def edit_message_text(self, text, **kwargs):
+        self.message.replies.append(text)
+
+
+def make_update(user_id, text='/joke', callback_data=None):
+    """Update with the attributes used by the handlers and the decorators."""
+    user = types.SimpleNamespace(id=user_id, username=f'user{user_id}',
+        first_name=f'First{user_id}', last_name=f'Last{user_id}',
+        language_code='en', is_bot=False)
+    chat = types.SimpleNamespace(id=user_id, type='private')
+    message = FakeMessage(user, chat, text)
+
+    update = types.SimpleNamespace(effective_user=user, effective_chat=chat,
+                                   effective_message=message, callback_query=None,
+                                   message=message)
+    if(callback_data is not None):
+        update.message = None
+        update.callback_query = FakeCallbackQuery(user, message, callback_data)
+
+    return update
+
+
+def make_context(args=()):
+    return types.SimpleNamespace(args=list(args), bot_data={}, chat_data={},
+                                 user_data={})
+
+
+# --------------------------------------------------------------------------------
+# database statements
+# --------------------------------------------------------------------------------
+_counts = threading.local()
+
+
+def count_statements(backend):
+    """Wraps the backend so every statement run by this thread is counted."""
+    for name in ['execute', 'executemany', 'stream']:
+        func = getattr(backend, name)
+
+        def wrapper(*args, _func=func, **kwargs):
+            if(getattr(_counts, 'enabled', False)):
+                _counts.n += 1
+            return _func(*args, **kwargs)
+
+        setattr(backend, name, wrapper)
+
+
+# --------------------------------------------------------------------------------
+# scenario
+# --------------------------------------------------------------------------------
+def populate(manager, nusers, njokes, nhistory):
+    now = datetime.datetime.now()
+
+    with manager.connection() as conn:
+        manager.insert_rows(conn, 'users',
+            ['id', 'privilege', 'first_name', 'last_name', 'username', 'language_code'],
+            ((i, 2 if i <= ADMINS else 0, f'First{i}', f'Last{i}', f'user{i}', 'en')
+             for i in range(1, nusers + 1)),
+            chunk_size=10000)
+
+        manager.insert_rows(conn, 'jokes', ['joke'],
+            ((f'benchmark joke number {i}',) for i in range(njokes)),
+            chunk_size=10000)
+
+        history = [
+            (random.randint(1, nusers), random.choice(COMMANDS),
+             now - datetime.timedelta(minutes=random.randint(0, 60 * 24 * 30)))
+            for _ in range(nhistory)
+        ]
+        manager.insert_rows(conn, 'commands', ['user_id', 'command', 'created_at'],
+                            history, chunk_size=10000)
+
+        rollups = collections.Counter(
+            (t.replace(minute=0, second=0, microsecond=0), user_id, command)
+            for user_id, command, t in history)
+        manager.upsert_rows(conn, 'command_stats',
+            ['hour', 'user_id', 'command', 'total'],
+            [(*key, total) for key, total in rollups.items()],
+            increment=['total'])
+
+
+def call(commands, handler, user_id):
+    if(handler == 'joke_search'):
+        commands.joke(make_update(user_id, text='/joke benchmark'),
+                      make_context(['benchmark']))
+        return
+    elif(handler == 'users_page'):
+        update = make_update(user_id, callback_data='users:1')
+    elif(handler == 'message'):
+        update = make_update(user_id, text='hello')
+    else:
+        update = make_update(user_id, text=f'/{handler}')
+
+    getattr(commands, handler)(update, make_context())
+
+
+def summarize(latencies, statements, allocated, peaks):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e3
+
+    return {
+        'updates': len(latencies),
+        'latency_ms': {
+            'mean': sum(latencies) / len(latencies) * 1e3,
+            'p50': percentile(0.50),
+            'p90': percentile(0.90),
+            'p99': percentile(0.99),
+        },
+        'db_statements_per_update': sum(statements) / len(statements),
+        'allocated_kib_per_update': sum(allocated) / len(allocated) / 1024,
+        'peak_kib': max(peaks) / 1024,
+    }
+
+
+def run_scenario(nusers, njokes, nhistory, iterations, alloc_iterations):
+    """Runs every handler in this process and returns the results."""
+    directory = tempfile.mkdtemp(prefix='xerta_bench_')
+    os.environ['XERTA_DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = str(pathlib.Path(directory) / 'bench.sqlite3')
+
+    from xerta_bot import commands, ratelimit
+    from xerta_bot.database import manager
+    from xerta_bot.database.backends import get_backend
+
+    populate(manager, nusers, njokes, nhistory)
+    count_statements(get_backend())
+
+    # lift the rate limits so every update reaches the database
+    for limiter in ratelimit.limiters.values():
+        limiter.rate = limiter.burst = 1e9
+        limiter.global_bucket = None
+
+    users = itertools.cycle(range(1, min(nusers, ADMINS) + 1))
+
+    results = {}
+    for handler in HANDLERS:
+        # warm up caches
+        for _ in range(5):
+            call(commands, handler, next(users))
+
+        latencies, statements = [], []
+        for _ in range(iterations):
+            _counts.n = 0
+            _counts.enabled = True
+
+            t0 = time.perf_counter()
+            call(commands, handler, next(users))
+            latencies.append(time.perf_counter() - t0)
+
+            _counts.enabled = False
+            statements.append(_counts.n)
+
+        allocated, peaks = [], []
+        tracemalloc.start()
+        for _ in range(alloc_iterations):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            call(commands, handler, next(users))
+            current, peak = tracemalloc.get_traced_memory()
+            allocated.append(max(0, current - before))
+            peaks.append(peak - before)
+        tracemalloc.stop()
+
+        results[handler] = summarize(latencies, statements, allocated, peaks)
+
+    return {
+        'scenario': {'users': nusers, 'jokes': njokes, 'history': nhistory},
+        'handlers': results,
+    }
+
+
+# --------------------------------------------------------------------------------
+# main
+# --------------------------------------------------------------------------------
+def parse_sizes(value):
+    return [int(size) for size in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=parse_sizes, default=[100, 10000])
+    parser.add_argument('--jokes', type=parse_sizes, default=[1000, 100000])
+    parser.add_argument('--history', type=parse_sizes, default=[10000])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--alloc-iterations', type=int, default=50)
+    parser.add_argument('--output', default=None, help='JSON file with the results')
+    parser.add_argument('--scenario', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if(args.scenario is not None):
+        # child process: run a single scenario
+        nusers, njokes, nhistory = parse_sizes(args.scenario)
+        result = run_scenario(nusers, njokes, nhistory, args.iterations,
+                              args.alloc_iterations)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for nusers, njokes, nhistory in itertools.product(args.users, args.jokes, args.history):
+        child = subprocess.run([sys.executable, '-m', 'benchmarks.pipeline',
+            '--scenario', f'{nusers},{njokes},{nhistory}',
+            '--iterations', str(args.iterations),
+            '--alloc-iterations', str(args.alloc_iterations)],
+            capture_output=True, text=True, check=True)
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+
+        print(f'users={nusers} jokes={njokes} history={nhistory}', file=sys.stderr)
+        for handler, stats in result['handlers'].items():
+            print(f'  {handler:>11}: p50 {stats["latency_ms"]["p50"]:7.3f} ms  '
+                  f'p99 {stats["latency_ms"]["p99"]:7.3f} ms  '
+                  f'{stats["db_statements_per_update"]:4.1f} statements  '
+                  f'{stats["allocated_kib_per_update"]:7.1f} KiB', file=sys.stderr)
+
+    report = {
+        'python': sys.version.split()[0],
+        'created_at': datetime.datetime.now().isoformat(),
+        'results': results,
+    }
+
+    if(args.output is not None):
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
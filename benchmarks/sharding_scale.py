@@ -0,0 +1,103 @@
+"""Throughput of the sharded runtime as the number of worker processes grows.
+
+The workers run a CPU bound function in place of the handlers, so no
+database nor Telegram is needed:
+
+    python -m benchmarks.sharding_scale --updates 20000 --chats 1000 --work 20000
+
+For each number of workers it prints the updates per second, the speedup
+over one worker and the efficiency (speedup / workers).  Workers are
+started and ready before the clock starts.
+"""
+import argparse
+import copy
+import json
+import os
+import pathlib
+import time
+
+# package imports
+from xerta_bot.sharding import ShardedRuntime
+
+
+UPDATE = pathlib.Path(__file__).parent / 'data' / 'update.json'
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def cpu_processor(index, nworkers):
+    """Processor that spends about the same CPU time on every update."""
+    work = int(os.environ.get('BENCHMARK_WORK', 20000))
+
+    def process(data):
+        total = 0
+        for i in range(work):
+            total += i * i
+        json.dumps(data)
+
+    return process, None
+
+
+def make_updates(n, chats):
+    with open(UPDATE, 'r') as f:
+        template = json.load(f)
+
+    updates = []
+    for i in range(n):
+        update = copy.deepcopy(template)
+        update['update_id'] = i
+        update['message']['chat']['id'] = update['message']['from']['id'] = i % chats
+        updates.append(update)
+
+    return updates
+
+
+def run(updates, workers):
+    runtime = ShardedRuntime(workers, cpu_processor, maxsize=len(updates))
+    runtime.start()
+
+    t0 = time.perf_counter()
+    for update in updates:
+        runtime.submit(update)
+    runtime.shutdown(wait=True, timeout=600)  # waits for every update
+    elapsed = time.perf_counter() - t0
+
+    return len(updates) / elapsed
+
+
+# --------------------------------------------------------------------------------
+# main
+# --------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--work', type=int, default=20000,
+                        help='loop iterations per update')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='numbers of workers, by default 1, 2, 4... up to the cores')
+    args = parser.parse_args()
+
+    os.environ['BENCHMARK_WORK'] = str(args.work)  # inherited by the workers
+
+    workers = args.workers
+    if(workers is None):
+        workers = [1]
+        while(workers[-1] * 2 <= os.cpu_count()):
+            workers.append(workers[-1] * 2)
+
+    updates = make_updates(args.updates, args.chats)
+
+    print(f'{"workers":>8} {"updates/s":>10} {"speedup":>8} {"efficiency":>10}')
+    base = None
+    for n in workers:
+        throughput = run(updates, n)
+        base = base or throughput
+
+        speedup = throughput / base
+        print(f'{n:>8} {throughput:>10.0f} {speedup:>8.2f} {speedup / n:>10.2f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Load test of the webhook server with a recorded update.
+
+The server runs on localhost and the updates are processed by a function
+that only simulates the work of a handler, so no database nor Telegram is
+needed:
+
+    python -m benchmarks.webhook_load --updates 20000 --chats 100
+
+It prints the updates per second and the p50/p99 handling latency, from the
+moment the request is sent until the update is processed.
+"""
+import argparse
+import copy
+import http.client
+import json
+import pathlib
+import threading
+import time
+
+# package imports
+from xerta_bot.executor import ChatExecutor
+from xerta_bot.webhook import SECRET_HEADER, WebhookServer
+
+
+UPDATE = pathlib.Path(__file__).parent / 'data' / 'update.json'
+SECRET = 'benchmark-secret'
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def make_updates(n, chats):
+    """Copies of the recorded update spread over several chats."""
+    with open(UPDATE, 'r') as f:
+        template = json.load(f)
+
+    updates = []
+    for i in range(n):
+        update = copy.deepcopy(template)
+        update['update_id'] = i
+        update['message']['chat']['id'] = update['message']['from']['id'] = i % chats
+        updates.append(json.dumps(update).encode())
+
+    return updates
+
+
+def run(updates, clients, workers, work):
+    sent = {}
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def process(data):
+        time.sleep(work)
+        with lock:
+            latencies.append(time.perf_counter() - sent[data['update_id']])
+            if(len(latencies) == len(updates)):
+                done.set()
+
+    server = WebhookServer(process, ChatExecutor(workers), secret_token=SECRET,
+                           port=0, queue_timeout=30)
+    server.start()
+    host, port = server.address
+
+    def client(chunk):
+        conn = http.client.HTTPConnection(host, port)
+        for i, body in chunk:
+            sent[i] = time.perf_counter()
+            conn.request('POST', '/webhook', body, {
+                'Content-Type': 'application/json',
+                SECRET_HEADER: SECRET,
+            })
+            conn.getresponse().read()
+        conn.close()
+
+    threads = [
+        threading.Thread(target=client, args=(list(enumerate(updates))[i::clients],))
+        for i in range(clients)
+    ]
+
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.wait()
+    elapsed = time.perf_counter() - t0
+
+    server.shutdown()
+
+    latencies.sort()
+    return {
+        'updates': len(updates),
+        'updates_per_second': len(updates) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1e3,
+        'p99_ms': latencies[int(0.99 * len(latencies))] * 1e3,
+        'server': server.stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=10000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--work', type=float, default=1.0,
+                        help='milliseconds of simulated work per update')
+    args = parser.parse_args()
+
+    updates = make_updates(args.updates, args.chats)
+    result = run(updates, args.clients, args.workers, args.work / 1e3)
+
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
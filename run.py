@@ -1,11 +1,22 @@
+import argparse
 import logging
 import os
+import signal
+import threading
+from telegram import Bot, Update
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
 
 # package import
 from xerta_bot import commands
+from xerta_bot.executor import ChatExecutor
+from xerta_bot.metrics import start_metrics_server, stop_metrics_server
+from xerta_bot.outbox import start_outbox, stop_outbox
+from xerta_bot.sharding import ShardedRuntime, poll
+from xerta_bot.webhook import WebhookServer
 from xerta_bot.database import manager
-from xerta_bot.database.managers.jokes import insert_joke
+from xerta_bot.database.managers.commands import start_audit_writer, stop_audit_writer
+from xerta_bot.database.managers.jokes import import_jokes, refresh_joke_ids
+from xerta_bot.database.managers.retention import start_retention, stop_retention
 
 # os.environ
 import secrets
@@ -26,7 +37,23 @@ def main():
 
     # Get the dispatcher to register handlers
     dp = updater.dispatcher
-    commands.setup(dp)
+
+    # Handle the updates of different chats in parallel
+    executor = ChatExecutor(int(os.getenv('BOT_WORKERS', 4)))
+    commands.setup(dp, executor)
+
+    # Build the joke search index before the first /joke
+    load_jokes()
+
+    # Write the commands table and send the replies in the background
+    start_audit_writer()
+    start_outbox(updater.bot)
+
+    # Serve the metrics unless XERTA_METRICS=0
+    start_metrics_server()
+
+    # Roll up and remove the expired commands in the background
+    start_retention()
 
     # Start the Bot
     updater.start_polling()
@@ -34,26 +61,154 @@ def main():
     # Run the bot until process receives SIGINT, SIGTERM or SIGABRT.
     updater.idle()
 
+    # Handle the pending updates before exiting
+    executor.shutdown()
+
+    # Send the pending replies and write the pending commands before exiting
+    stop_outbox()
+    stop_audit_writer()
+    stop_metrics_server()
+    stop_retention()
+
+
+# --------------------------------------------------------------------------------
+# webhook
+# --------------------------------------------------------------------------------
+def main_webhook():
+    updater = Updater(os.getenv('TOKEN'), use_context=True)
+
+    # Get the dispatcher to register handlers.  The webhook workers call it.
+    dp = updater.dispatcher
+    commands.setup(dp)
+
+    def process(data):
+        dp.process_update(Update.de_json(data, updater.bot))
+
+    # Receive the updates in a local HTTP server
+    secret_token = os.getenv('WEBHOOK_SECRET')
+    executor = ChatExecutor(int(os.getenv('BOT_WORKERS', 4)),
+                            int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)))
+    server = WebhookServer(process, executor,
+        secret_token=secret_token,
+        host=os.getenv('WEBHOOK_HOST', '127.0.0.1'),
+        port=int(os.getenv('WEBHOOK_PORT', 8443)),
+        path=os.getenv('WEBHOOK_PATH', '/webhook')
+    )
+
+    # Tell Telegram where to send the updates
+    url = os.getenv('WEBHOOK_URL')
+    if(url is not None):
+        api_kwargs = {'secret_token': secret_token} if secret_token else None
+        updater.bot.set_webhook(url, api_kwargs=api_kwargs)
+
+    # Build the joke search index before the first /joke
+    load_jokes()
+
+    # Write the commands table and send the replies in the background
+    start_audit_writer()
+    start_outbox(updater.bot)
+
+    # Serve the metrics unless XERTA_METRICS=0
+    start_metrics_server()
+
+    # Roll up and remove the expired commands in the background
+    start_retention()
+
+    # Run the bot until process receives SIGINT or SIGTERM.
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    server.start()
+    logger.info('Webhook listening on %s:%s', *server.address)
+    stop.wait()
+
+    # Handle the queued updates, send the pending replies and write the
+    # pending commands before exiting
+    server.shutdown()
+    stop_outbox()
+    stop_audit_writer()
+    stop_metrics_server()
+    stop_retention()
+
+
+# --------------------------------------------------------------------------------
+# sharded
+# --------------------------------------------------------------------------------
+def main_sharded(workers, webhook=False):
+    # Handle the updates in worker processes, each one with its own
+    # dispatcher and database pool
+    runtime = ShardedRuntime(workers, maxsize=int(os.getenv('SHARD_QUEUE_SIZE', 1000)))
+    runtime.start()
+
+    # Roll up and remove the expired commands once, not in every worker
+    start_retention()
+
+    # Run the bot until process receives SIGINT or SIGTERM.
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    bot = Bot(os.getenv('TOKEN'))
+
+    if(webhook):
+        # A single intake thread keeps the order of each chat
+        secret_token = os.getenv('WEBHOOK_SECRET')
+        server = WebhookServer(runtime.submit, ChatExecutor(1),
+            secret_token=secret_token,
+            host=os.getenv('WEBHOOK_HOST', '127.0.0.1'),
+            port=int(os.getenv('WEBHOOK_PORT', 8443)),
+            path=os.getenv('WEBHOOK_PATH', '/webhook')
+        )
+
+        url = os.getenv('WEBHOOK_URL')
+        if(url is not None):
+            api_kwargs = {'secret_token': secret_token} if secret_token else None
+            bot.set_webhook(url, api_kwargs=api_kwargs)
+
+        server.start()
+        logger.info('Webhook listening on %s:%s', *server.address)
+        stop.wait()
+        server.shutdown()
+    else:
+        poll(bot, runtime, stop)
+
+    # Handle the queued updates before exiting
+    runtime.shutdown()
+    stop_retention()
+
 
 # --------------------------------------------------------------------------------
 # setup jokes table
 # --------------------------------------------------------------------------------
 def setup_jokes():
     path = f'data/jokes.txt'
-    with open(path, 'r') as f:
-        jokes = f.read()
-    
-    jokes = jokes.split('\n\n')
 
-    conn = manager.connect()
-    for joke in jokes:
-        joke = ' '.join(joke.split())
-        
-        insert_joke(conn, joke)
+    with manager.connection() as conn:
+        import_jokes(conn, path)
+
+
+def load_jokes():
+    with manager.connection() as conn:
+        njokes = refresh_joke_ids(conn)
+
+    logger.info('Indexed %d jokes.', njokes)
 
 
 # --------------------------------------------------------------------------------
 # main
 # --------------------------------------------------------------------------------
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Run XertaBot.')
+    parser.add_argument('--webhook', action='store_true',
+                        help='receive updates in a local HTTP server instead of polling')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='handle the updates in this many processes, sharded by chat')
+    args = parser.parse_args()
+
+    if(args.workers > 0):
+        main_sharded(args.workers, args.webhook)
+    elif(args.webhook):
+        main_webhook()
+    else:
+        main()
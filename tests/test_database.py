@@ -0,0 +1,246 @@
+"""Tests of the database layer on the SQLite backend, with a temporary
+database file, so no MySQL server is needed:
+
+    python -m pytest tests
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+# package imports
+from xerta_bot.database import backends, manager, statements
+from xerta_bot.database.formater import fmt_identifier
+from xerta_bot.database.managers import retention
+
+
+_tmpdir = None
+
+
+def setUpModule():
+    global _tmpdir
+
+    _tmpdir = tempfile.mkdtemp()
+    os.environ['SQLITE_PATH'] = os.path.join(_tmpdir, 'test.sqlite3')
+    backends.set_backend('sqlite')
+
+
+def tearDownModule():
+    shutil.rmtree(_tmpdir, ignore_errors=True)
+
+
+class DatabaseTest(unittest.TestCase):
+    """Empties the tables used by the tests before each one."""
+    TABLES = ('commands', 'command_stats', 'command_daily', 'jokes', 'users')
+
+    def setUp(self):
+        self.conn = manager.connect()
+        for table in self.TABLES:
+            manager.reset_table(self.conn, table)
+
+        manager.upsert_rows(self.conn, 'users', ['id', 'first_name'],
+                            [(1, 'a'), (2, 'b')])
+
+    def tearDown(self):
+        self.conn.close()
+
+
+# --------------------------------------------------------------------------------
+# statements
+# --------------------------------------------------------------------------------
+class UpsertSqlTest(unittest.TestCase):
+
+    def test_mysql(self):
+        self.assertEqual(
+            statements.upsert_sql('command_stats', ('hour', 'user_id', 'total'),
+                                  ('hour', 'user_id'), ('total',), dialect='mysql'),
+            'INSERT INTO command_stats (hour, user_id, total) VALUES (%s, %s, %s) '
+            'ON DUPLICATE KEY UPDATE total=total+VALUES(total)')
+
+    def test_sqlite(self):
+        self.assertEqual(
+            statements.upsert_sql('users', ('id', 'first_name'), ('id',),
+                                  dialect='sqlite'),
+            'INSERT INTO users (id, first_name) VALUES (%s, %s) '
+            'ON CONFLICT (id) DO UPDATE SET first_name=excluded.first_name')
+
+        self.assertEqual(
+            statements.upsert_sql('command_stats', ('hour', 'user_id', 'total'),
+                                  ('hour', 'user_id'), ('total',), dialect='sqlite'),
+            'INSERT INTO command_stats (hour, user_id, total) VALUES (%s, %s, %s) '
+            'ON CONFLICT (hour, user_id) DO UPDATE SET total=total+excluded.total')
+
+    def test_only_keys(self):
+        self.assertEqual(
+            statements.upsert_sql('users', ('id',), ('id',), dialect='sqlite'),
+            'INSERT INTO users (id) VALUES (%s) ON CONFLICT (id) DO NOTHING')
+        self.assertEqual(
+            statements.upsert_sql('users', ('id',), ('id',), dialect='mysql'),
+            'INSERT INTO users (id) VALUES (%s) ON DUPLICATE KEY UPDATE id=id')
+
+
+class UpsertTest(DatabaseTest):
+
+    def test_replace(self):
+        manager.upsert_row(self.conn, 'users', ['id', 'first_name'], [1, 'c'])
+        manager.upsert_row(self.conn, 'users', ['id', 'first_name'], [3, 'd'])
+
+        rows = manager.select(self.conn, 'users', ['id', 'first_name'],
+                              order_by=['id'])
+        self.assertEqual(rows, [(1, 'c'), (2, 'b'), (3, 'd')])
+
+    def test_increment(self):
+        hour = datetime.datetime(2024, 1, 1, 10)
+        columns = ['hour', 'user_id', 'command', 'total']
+
+        manager.upsert_rows(self.conn, 'command_stats', columns,
+                            [(hour, 1, 'joke', 2), (hour, 2, 'joke', 1)],
+                            increment=['total'])
+        manager.upsert_rows(self.conn, 'command_stats', columns,
+                            [(hour, 1, 'joke', 3)], increment=['total'])
+
+        rows = manager.select(self.conn, 'command_stats', ['user_id', 'total'],
+                              order_by=['user_id'])
+        self.assertEqual(rows, [(1, 5), (2, 1)])
+
+
+# --------------------------------------------------------------------------------
+# identifiers
+# --------------------------------------------------------------------------------
+class IdentifierTest(DatabaseTest):
+
+    INJECTED = ['users; DROP TABLE users', 'users\n', 'id=1 OR 1', '1users',
+                'users--', 'first name', '`users`', '']
+
+    def test_fmt_identifier(self):
+        self.assertEqual(fmt_identifier('command_stats'), 'command_stats')
+
+        for name in self.INJECTED + [None, 1]:
+            with self.assertRaises(ValueError, msg=repr(name)):
+                fmt_identifier(name)
+
+    def test_rejected_before_query(self):
+        for name in self.INJECTED:
+            with self.assertRaises(ValueError, msg=repr(name)):
+                manager.select(self.conn, 'users', [name], cache=False)
+            with self.assertRaises(ValueError, msg=repr(name)):
+                manager.select(self.conn, 'users', ['id'], where={name: 1},
+                               cache=False)
+
+        self.assertEqual(manager.count_rows(self.conn, 'users'), 2)
+
+
+# --------------------------------------------------------------------------------
+# query result cache
+# --------------------------------------------------------------------------------
+class CacheTest(DatabaseTest):
+
+    def select(self):
+        return manager.select(self.conn, 'users', ['id', 'first_name'],
+                              order_by=['id'], cache=True)
+
+    def hits(self):
+        return manager.cache_stats()['hits']
+
+    def test_hit(self):
+        rows = self.select()
+
+        hits = self.hits()
+        self.assertEqual(self.select(), rows)
+        self.assertEqual(self.hits(), hits + 1)
+
+    def test_invalidated_by_writes(self):
+        writes = [
+            lambda: manager.insert_row(self.conn, 'users', ['id', 'first_name'], [3, 'c']),
+            lambda: manager.insert_rows(self.conn, 'users', ['id', 'first_name'], [(4, 'd')]),
+            lambda: manager.upsert_row(self.conn, 'users', ['id', 'first_name'], [1, 'e']),
+            lambda: manager.upsert_rows(self.conn, 'users', ['id', 'first_name'], [(2, 'f')]),
+            lambda: manager.update_column(self.conn, 'users', 'first_name', 'g', id=3),
+            lambda: manager.delete_values(self.conn, 'users', id=4),
+            lambda: manager.reset_table(self.conn, 'users'),
+        ]
+
+        for write in writes:
+            self.select()
+            write()
+
+            expected = manager.select(self.conn, 'users', ['id', 'first_name'],
+                                      order_by=['id'], cache=False)
+            self.assertEqual(self.select(), expected)
+
+    def test_other_tables_kept(self):
+        self.select()
+        manager.insert_row(self.conn, 'jokes', ['joke'], ['a joke'])
+
+        hits = self.hits()
+        self.select()
+        self.assertEqual(self.hits(), hits + 1)
+
+
+# --------------------------------------------------------------------------------
+# retention
+# --------------------------------------------------------------------------------
+class RetentionTest(DatabaseTest):
+
+    NOW = datetime.datetime(2024, 1, 10, 12)
+
+    def setUp(self):
+        super().setUp()
+
+        # 2 commands a day from the 1st to the 10th, 3 on the 5th
+        rows = []
+        for day in range(1, 11):
+            t = datetime.datetime(2024, 1, day, 9)
+            rows += [(1, 'joke', t), (2, 'help', t)]
+        rows.append((1, 'joke', datetime.datetime(2024, 1, 5, 23, 59)))
+
+        manager.insert_rows(self.conn, 'commands',
+                            ['user_id', 'command', 'created_at'], rows)
+
+    def daily(self):
+        return manager.query(self.conn,
+            'SELECT day, user_id, command, total FROM command_daily '
+            'ORDER BY day, user_id')
+
+    def test_rollup_day(self):
+        day = datetime.datetime(2024, 1, 5)
+
+        self.assertTrue(retention.rollup_day(self.conn, day))
+        self.assertFalse(retention.rollup_day(self.conn, day))  # only once
+
+        self.assertEqual(self.daily(), [(datetime.date(2024, 1, 5), 1, 'joke', 2),
+                                        (datetime.date(2024, 1, 5), 2, 'help', 1)])
+
+    def test_run_retention(self):
+        stats = retention.run_retention(self.conn, days=3, batch_size=4,
+                                        pause=0, now=self.NOW)
+
+        # the 1st to the 7th expire, 8th, 9th and 10th are kept
+        self.assertEqual(stats, {'rolled_up': 7, 'dropped': 0, 'deleted': 15})
+        self.assertEqual(manager.count_rows(self.conn, 'commands'), 6)
+
+        rows = self.daily()
+        self.assertEqual(len(rows), 14)
+        self.assertEqual(sum(row[3] for row in rows), 15)
+
+        # nothing left to do
+        stats = retention.run_retention(self.conn, days=3, pause=0, now=self.NOW)
+        self.assertEqual(stats, {'rolled_up': 0, 'dropped': 0, 'deleted': 0})
+
+    def test_max_days(self):
+        stats = retention.run_retention(self.conn, days=3, max_days=2, pause=0,
+                                        now=self.NOW)
+
+        # only the rolled up days are deleted
+        self.assertEqual(stats, {'rolled_up': 2, 'dropped': 0, 'deleted': 4})
+        self.assertEqual(manager.count_rows(self.conn, 'commands'), 17)
+
+        stats = retention.run_retention(self.conn, days=3, pause=0, now=self.NOW)
+        self.assertEqual(stats['rolled_up'], 5)
+        self.assertEqual(manager.count_rows(self.conn, 'commands'), 6)
+        self.assertEqual(sum(row[3] for row in self.daily()), 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
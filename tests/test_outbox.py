@@ -0,0 +1,189 @@
+"""Tests of xerta_bot.outbox with a fake bot, so no Telegram is needed:
+
+    python -m pytest tests
+"""
+import threading
+import time
+import unittest
+
+# package imports
+from xerta_bot.outbox import Outbox
+
+
+# --------------------------------------------------------------------------------
+# fake bot
+# --------------------------------------------------------------------------------
+class RetryAfter(Exception):
+    """Same attribute as telegram.error.RetryAfter."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Retry in {retry_after} s')
+        self.retry_after = retry_after
+
+
+class FakeBot:
+    """Records every message sent.  The first calls for a chat can fail
+    with the errors queued in failures."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []  # (time, chat id, text, kwargs)
+        self.calls = []  # (time, chat id) of every call, failed or not
+        self.failures = {}  # chat id -> list of exceptions
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            self.calls.append((time.monotonic(), chat_id))
+            failures = self.failures.get(chat_id)
+            error = failures.pop(0) if failures else None
+
+        time.sleep(self.delay)
+        if(error is not None):
+            raise error
+
+        with self._lock:
+            self.sent.append((time.monotonic(), chat_id, text, kwargs))
+
+    def times(self, chat_id):
+        return [t for t, c, _, _ in self.sent if c == chat_id]
+
+    def first_call(self, chat_id):
+        return min(t for t, c in self.calls if c == chat_id)
+
+    def texts(self, chat_id):
+        return [text for _, c, text, _ in self.sent if c == chat_id]
+
+
+# --------------------------------------------------------------------------------
+# tests
+# --------------------------------------------------------------------------------
+TOLERANCE = 0.01  # seconds of clock and scheduling error
+
+
+class OutboxTest(unittest.TestCase):
+
+    def test_chat_pacing(self):
+        bot = FakeBot()
+        outbox = Outbox(bot, chat_rate=20, global_rate=1000, senders=4,
+                        coalesce=False)
+        outbox.start()
+
+        for i in range(5):
+            outbox.send(1, f'a{i}')
+            outbox.send(2, f'b{i}')
+        outbox.stop(timeout=5)
+
+        for chat_id, prefix in ((1, 'a'), (2, 'b')):
+            self.assertEqual(bot.texts(chat_id), [f'{prefix}{i}' for i in range(5)])
+
+            times = bot.times(chat_id)
+            gaps = [t1 - t0 for t0, t1 in zip(times, times[1:])]
+            self.assertGreaterEqual(min(gaps), 1 / 20 - TOLERANCE)
+
+        # the chats are paced apart, not one after the other
+        self.assertLess(abs(bot.times(1)[0] - bot.times(2)[0]), 1 / 20)
+
+    def test_global_rate(self):
+        bot = FakeBot()
+        outbox = Outbox(bot, chat_rate=1000, global_rate=20, senders=4)
+        outbox.start()
+
+        t0 = time.monotonic()
+        for chat_id in range(40):
+            outbox.send(chat_id, 'hi')
+        outbox.stop(timeout=10)
+
+        # a burst of 20, then 20 per second
+        self.assertEqual(len(bot.sent), 40)
+        self.assertGreaterEqual(time.monotonic() - t0, 1.0 - TOLERANCE)
+
+    def test_retry_after(self):
+        bot = FakeBot()
+        bot.failures[1] = [RetryAfter(0.3)]
+
+        outbox = Outbox(bot, chat_rate=100, global_rate=1000, coalesce=False)
+        outbox.start()
+
+        outbox.send(1, 'first')
+        outbox.send(1, 'second')
+        outbox.send(2, 'other chat')
+        outbox.stop(timeout=5)
+
+        # the message is sent again, in order, after the pause asked for
+        self.assertEqual(bot.texts(1), ['first', 'second'])
+        self.assertGreaterEqual(bot.times(1)[0] - bot.first_call(1), 0.3 - TOLERANCE)
+
+        # other chats are not paused
+        self.assertLess(bot.times(2)[0] - bot.first_call(1), 0.3)
+
+        self.assertEqual(outbox.stats['retried'], 1)
+        self.assertEqual(outbox.stats['sent'], 3)
+        self.assertEqual(outbox.stats['failed'], 0)
+
+    def test_max_retries(self):
+        bot = FakeBot()
+        bot.failures[1] = [RuntimeError('network')] * 3
+
+        outbox = Outbox(bot, chat_rate=100, global_rate=1000, max_retries=2)
+        outbox.start()
+
+        outbox.send(1, 'lost')
+        outbox.send(1, 'next', reply_markup='markup')
+        outbox.stop(timeout=5)
+
+        self.assertEqual(bot.texts(1), ['next'])
+        self.assertEqual(outbox.stats['retried'], 2)
+        self.assertEqual(outbox.stats['failed'], 1)
+
+    def test_coalesce(self):
+        bot = FakeBot()
+        outbox = Outbox(bot, chat_rate=100, global_rate=1000)
+
+        # queued before the senders start, so they all wait together
+        outbox.send(1, 'a')
+        outbox.send(1, 'b')
+        outbox.send(1, 'c', reply_markup='markup')
+        outbox.send(1, 'd')
+        outbox.send(1, 'e')
+
+        outbox.start()
+        outbox.stop(timeout=5)
+
+        # messages with other arguments are never joined
+        self.assertEqual(bot.texts(1), ['a\n\nb', 'c', 'd\n\ne'])
+        self.assertEqual(bot.sent[1][3], {'reply_markup': 'markup'})
+        self.assertEqual(outbox.stats['coalesced'], 2)
+
+    def test_coalesce_length(self):
+        bot = FakeBot()
+        outbox = Outbox(bot, chat_rate=100, global_rate=1000)
+
+        outbox.send(1, 'x' * 3000)
+        outbox.send(1, 'y' * 3000)
+        outbox.start()
+        outbox.stop(timeout=5)
+
+        self.assertEqual(len(bot.sent), 2)
+        self.assertEqual(outbox.stats['coalesced'], 0)
+
+    def test_stop_drains(self):
+        bot = FakeBot(delay=0.01)
+        outbox = Outbox(bot, chat_rate=50, global_rate=1000, senders=2,
+                        coalesce=False)
+        outbox.start()
+
+        for chat_id in range(10):
+            for i in range(3):
+                outbox.send(chat_id, str(i))
+        outbox.stop(timeout=10)
+
+        self.assertEqual(outbox.pending(), 0)
+        self.assertEqual(len(bot.sent), 30)
+        for chat_id in range(10):
+            self.assertEqual(bot.texts(chat_id), ['0', '1', '2'])
+        self.assertFalse(any(thread.is_alive() for thread in outbox._threads))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Tests of xerta_bot.webhook that POST the recorded update of the
+benchmarks to a local server, so no Telegram is needed:
+
+    python -m pytest tests
+"""
+import copy
+import http.client
+import json
+import pathlib
+import socket
+import threading
+import unittest
+
+# package imports
+from xerta_bot.executor import ChatExecutor
+from xerta_bot.webhook import SECRET_HEADER, WebhookServer
+
+
+UPDATE = pathlib.Path(__file__).parents[1] / 'benchmarks' / 'data' / 'update.json'
+SECRET = 'test-secret'
+
+
+# --------------------------------------------------------------------------------
+# tests
+# --------------------------------------------------------------------------------
+class WebhookTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(UPDATE, 'r') as f:
+            self.update = json.load(f)
+
+        self.processed = []
+        self.done = threading.Event()
+        self.server = self.start_server(self.process)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def process(self, data):
+        self.processed.append(data)
+        self.done.set()
+
+    def start_server(self, process, workers=2, maxsize=1000, **kwargs):
+        server = WebhookServer(process, ChatExecutor(workers, maxsize),
+                               secret_token=SECRET, port=0, **kwargs)
+        server.start()
+        return server
+
+    def post(self, body, secret=SECRET, path='/webhook', server=None):
+        host, port = (server or self.server).address[:2]
+        if(not isinstance(body, bytes)):
+            body = json.dumps(body).encode()
+
+        headers = {'Content-Type': 'application/json'}
+        if(secret is not None):
+            headers[SECRET_HEADER] = secret
+
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+        try:
+            conn.request('POST', path, body, headers)
+            return conn.getresponse().status
+        finally:
+            conn.close()
+
+    def test_accepted(self):
+        self.assertEqual(self.post(self.update), 200)
+
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.processed, [self.update])
+        self.assertEqual(self.server.stats['accepted'], 1)
+
+    def test_secret(self):
+        self.assertEqual(self.post(self.update, secret='wrong'), 403)
+        self.assertEqual(self.post(self.update, secret=None), 403)
+        self.assertEqual(self.server.stats['rejected'], 2)
+
+    def test_malformed(self):
+        no_chat = copy.deepcopy(self.update)
+        del no_chat['message']['chat']
+
+        for body in ([1, 2], {}, no_chat, b'not json', b'"text"'):
+            self.assertEqual(self.post(body), 400, body)
+        self.assertEqual(self.server.stats['invalid'], 5)
+
+    def test_not_found(self):
+        self.assertEqual(self.post(self.update, path='/other'), 404)
+
+    def test_too_large(self):
+        server = self.start_server(self.process, max_body=100)
+        try:
+            self.assertEqual(self.post(self.update, server=server), 413)
+            self.assertEqual(server.stats['too_large'], 1)
+        finally:
+            server.shutdown()
+
+    def test_bad_content_length(self):
+        host, port = self.server.address[:2]
+        request = (f'POST /webhook HTTP/1.1\r\nHost: {host}\r\n'
+                   f'{SECRET_HEADER}: {SECRET}\r\nContent-Length: abc\r\n\r\n')
+
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.sendall(request.encode())
+            response = sock.recv(1024).decode()
+
+        self.assertTrue(response.startswith('HTTP/1.1 400'), response)
+
+    def test_rejected_body_is_not_parsed(self):
+        # the body of a 404 must not be read as the next request of the
+        # connection
+        host, port = self.server.address[:2]
+        body = b'GET /webhook HTTP/1.1\r\n\r\n'
+        request = (f'POST /other HTTP/1.1\r\nHost: {host}\r\n'
+                   f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.sendall(request)
+            response = b''
+            while(True):
+                data = sock.recv(1024)
+                if(not data):
+                    break
+                response += data
+
+        self.assertEqual(response.count(b'HTTP/1.1 '), 1, response)
+        self.assertTrue(response.startswith(b'HTTP/1.1 404'), response)
+
+    def test_queue_full(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def process(data):
+            started.set()
+            release.wait(5)
+
+        server = self.start_server(process, workers=1, maxsize=1,
+                                   queue_timeout=0.05)
+        try:
+            self.assertEqual(self.post(self.update, server=server), 200)
+            started.wait(5)  # the worker holds the first update
+            self.assertEqual(self.post(self.update, server=server), 200)
+            self.assertEqual(self.post(self.update, server=server), 503)
+            self.assertEqual(server.stats['busy'], 1)
+        finally:
+            release.set()
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,73 +1,148 @@
-import pathlib
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Updater, CallbackQueryHandler, CommandHandler, MessageHandler, Filters
 
 
 # package imports
-from .wrappers import command, public, private, restricted
+from . import messages
+from .metrics import observed
+from .outbox import reply
+from .wrappers import command, public, private, restricted, throttled
 from .database import manager
+from .database.managers.analytics import hourly_counts, top_commands, total_commands
 from .database.managers.jokes import random_joke
-from .database.managers.users import get_users
+from .database.managers.users import count_users, list_users
 
 
 # --------------------------------------------------------------------------------
 # setup commands
 # --------------------------------------------------------------------------------
-def setup(dp):
+def setup(dp, executor=None):
+    # run the handlers in the worker pool if there is one
+    run = executor.wrap if executor is not None else (lambda func: func)
+
     # on different commands - answer in Telegram
-    dp.add_handler(CommandHandler('start', start))
-    dp.add_handler(CommandHandler('help', start))
-    dp.add_handler(CommandHandler('joke', joke))
-    dp.add_handler(CommandHandler('users', users))
+    dp.add_handler(CommandHandler('start', run(start)))
+    dp.add_handler(CommandHandler('help', run(start)))
+    dp.add_handler(CommandHandler('joke', run(joke)))
+    dp.add_handler(CommandHandler('users', run(users)))
+    dp.add_handler(CommandHandler('stats', run(stats)))
+
+    # on inline buttons
+    dp.add_handler(CallbackQueryHandler(run(users_page), pattern=r'^users:\d+$'))
 
     # on noncommand i.e message - echo the message on Telegram
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, message))
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, run(message)))
 
 
 # --------------------------------------------------------------------------------
 # Telegram commands
 # --------------------------------------------------------------------------------
+@observed
+@throttled()
 @public
 @command
 def start(update, context):
     """Send a message when the command /start is issued."""
-    path = f'{pathlib.Path(__file__).parent.absolute()}/database/messages/start.txt'
-
-    with open(path, mode='r') as f:
-        msg = f.read()
+    user = update.message.from_user
+    msg = messages.render('start', user.language_code, first_name=user.first_name)
 
-    update.message.reply_text(msg)
+    reply(update, msg)
 
 
+@observed
+@throttled(rate=0.5, burst=3, global_rate=30)
 @public
 @command
 def joke(update, context):
-    """Send a message when the command /joke is issued."""
-    conn = manager.connect()
-    update.message.reply_text(random_joke(conn))
+    """Send a message when the command /joke is issued.  With words after
+    the command, /joke <words>, the joke must contain all of them."""
+    query = ' '.join(context.args or [])
+
+    with manager.connection() as conn:
+        msg = random_joke(conn, query or None)
+
+    if(msg is None and query):
+        msg = f'Sorry, I do not know any joke about {query}.'
+    elif(msg is None):
+        msg = 'Sorry, I do not know any joke.'
+
+    reply(update, msg)
 
 
 # --------------------------------------------------------------------------------
 # Message Handler
 # --------------------------------------------------------------------------------
+@observed
+@throttled()
 @public
 @command
 def message(update, context):
     """Handles the event where the user writes a message."""
-    update.message.reply_text('Jajaja, you are very funny.')
+    reply(update, 'Jajaja, you are very funny.')
 
 
 # --------------------------------------------------------------------------------
 # Message Handler
 # --------------------------------------------------------------------------------
+USERS_PAGE_SIZE = 50
+
+
+@observed
+@throttled()
 @restricted
 @command
 def users(update, context):
-    """Send a message when the command /joke is issued."""
-    conn = manager.connect()
-    df = get_users(conn, privilege=0)
-    
-    df = df[['first_name', 'last_name']].dropna()
-    df['full_name'] = df['first_name'] + ' ' + df['last_name']
-    
-    users_msg = '\n'.join( df['full_name'].values )
-    update.message.reply_text(f'Users connected: \n{users_msg}')
\ No newline at end of file
+    """Send the first page of users when the command /users is issued."""
+    msg, markup = users_message(0)
+    reply(update, msg, reply_markup=markup)
+
+
+@observed
+@throttled(rate=2, burst=5)
+@restricted
+def users_page(update, context):
+    """Show another page of users when a button of /users is pressed."""
+    query = update.callback_query
+    page = int(query.data.split(':')[1])
+
+    msg, markup = users_message(page)
+    query.answer()
+    query.edit_message_text(msg, reply_markup=markup)
+
+
+def users_message(page):
+    """Text and buttons of a page of the users list."""
+    with manager.connection() as conn:
+        nusers = count_users(conn, privilege=0)
+        rows = list_users(conn, privilege=0,
+                          limit=USERS_PAGE_SIZE, offset=page*USERS_PAGE_SIZE)
+
+    npages = max(1, -(-nusers // USERS_PAGE_SIZE))
+    names = [' '.join(name for name in row if name) for row in rows]
+    users_msg = '\n'.join(names)
+
+    buttons = []
+    if(page > 0):
+        buttons.append(InlineKeyboardButton('« Prev', callback_data=f'users:{page - 1}'))
+    if(page + 1 < npages):
+        buttons.append(InlineKeyboardButton('Next »', callback_data=f'users:{page + 1}'))
+    markup = InlineKeyboardMarkup([buttons]) if buttons else None
+
+    msg = f'Users connected ({nusers}), page {page + 1}/{npages}: \n{users_msg}'
+    return msg, markup
+
+
+@observed
+@throttled()
+@restricted
+@command
+def stats(update, context):
+    """Send usage statistics when the command /stats is issued."""
+    with manager.connection() as conn:
+        total = total_commands(conn)
+        top = top_commands(conn, 5)
+        last_day = sum(n for _, n in hourly_counts(conn, 24))
+
+    top_msg = '\n'.join(f'{cmd}: {n}' for cmd, n in top)
+    reply(update,
+        f'Commands used: {total}\nLast 24 hours: {last_day}\n\nTop commands:\n{top_msg}')
\ No newline at end of file
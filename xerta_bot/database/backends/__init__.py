@@ -0,0 +1,89 @@
+import importlib
+import os
+import threading
+
+
+# ------------------------------------------------------------------------
+# storage backends
+# ------------------------------------------------------------------------
+# Every backend is a module with the same functions:
+#
+#   DIALECT                              name used by the statements module
+#   connect()                            pooled connection, closed by the caller
+#   execute(conn, sql, params)           cursor that executed a statement
+#   executemany(conn, sql, rows)         number of rows affected
+#   stream(conn, sql, params, size)      generator of batches of rows
+#   describe(conn, table)                tuples (column, type, is primary key)
+#   list_tables(conn)                    table names
+#   reset_table(conn, table)             delete every row and reset the ids
+#   create_tables(conn)                  create the tables of the bot
+#   integrity_error()                    exception raised on duplicated keys
+#
+# Backends that support range partitions also have:
+#
+#   list_partitions(conn, table)         tuples (name, upper bound)
+#   add_partitions(conn, table, parts)   split the MAXVALUE partition
+#   drop_partition(conn, table, name)    drop a partition and its rows
+#
+# Statements always use %s placeholders.  Backends translate them if their
+# driver uses another paramstyle.
+BACKENDS = {
+    'mysql': 'xerta_bot.database.backends.mysql',
+    'sqlite': 'xerta_bot.database.backends.sqlite',
+}
+
+_backend = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns the backend selected with the XERTA_DB_BACKEND environment
+    variable, 'mysql' (default) or 'sqlite'.
+
+    Returns
+    -------
+    backend: module
+        Module that implements the backend functions.
+    """
+    global _backend
+
+    if(_backend is None):
+        with _lock:
+            if(_backend is None):
+                _backend = load_backend(os.environ.get('XERTA_DB_BACKEND', 'mysql'))
+
+    return _backend
+
+
+def load_backend(name):
+    """Imports a backend by name.
+
+    Parameters
+    ----------
+    name: str
+        'mysql' or 'sqlite'.
+
+    Returns
+    -------
+    backend: module
+        Module that implements the backend functions.
+    """
+    if(name not in BACKENDS):
+        raise ValueError(f'Unknown database backend: {name!r}')
+
+    return importlib.import_module(BACKENDS[name])
+
+
+def set_backend(name):
+    """Selects the backend used from now on.  Mostly useful for tests and
+    benchmarks.
+
+    Parameters
+    ----------
+    name: str
+        'mysql' or 'sqlite'.
+    """
+    global _backend
+
+    with _lock:
+        _backend = load_backend(name)
@@ -0,0 +1,357 @@
+import importlib
+import os
+import pathlib
+import re
+import threading
+
+# package imports
+from ..formater import fmt_identifier
+
+
+DIALECT = 'mysql'
+
+SCHEMA_PATH = pathlib.Path(__file__).parent.parent / 'create-tables.sql'
+
+
+# ------------------------------------------------------------------------
+# connection
+# ------------------------------------------------------------------------
+def connect():
+    """Checks out a connection from the process-wide connection pool.  To
+    assign every parameter, the following scheme should be followed:
+
+    import os
+    
+    os.environ['MYSQL_HOST'] = 'localhost'
+    os.environ['MYSQL_USER'] = 'username'
+    os.environ['MYSQL_PASSWORD'] = 'pass1234'
+    os.environ['MYSQL_DATABASE'] = 'dabase_name'
+    os.environ['MYSQL_POOL_SIZE'] = '5'
+    os.environ['MYSQL_POOL_TIMEOUT'] = '10'
+
+    The connection is pinged before being returned and reconnected if the
+    server closed it.  Calling ``conn.close()`` gives it back to the pool.
+
+    Parameters
+    ----------
+    MYSQL_HOST: str
+        MySQL host.
+    
+    MYSQL_USERNAME: str
+        MySQL username.
+
+    MYSQL_PASSWORD: str
+        MySQL password.
+
+    MYSQL_DATABASE: str
+        Database name.
+
+    MYSQL_POOL_SIZE: int, optional
+        Number of connections kept open by the pool.  By default 5.
+
+    MYSQL_POOL_TIMEOUT: float, optional
+        Seconds to wait for a free connection before giving up.  By
+        default 10.
+
+    Returns
+    -------
+    conn: mysql.connector.pooling.PooledMySQLConnection
+        connection with MySQL server.
+    """
+    pool, slots = _get_pool()
+
+    timeout = float(os.environ.get('MYSQL_POOL_TIMEOUT', 10))
+    if(not slots.acquire(timeout=timeout)):
+        raise _mysql().errors.PoolError(
+            f'No connection available in pool after {timeout} seconds.')
+
+    try:
+        conn = pool.get_connection()
+
+        # health check.  Stale connections are reopened transparently.
+        conn.ping(reconnect=True, attempts=3, delay=1)
+    except Exception:
+        slots.release()
+        raise
+
+    return _PooledConnection(conn, slots)
+
+
+# ------------------------------------------------------------------------
+# statements
+# ------------------------------------------------------------------------
+PREPARED_CACHE_SIZE = 64  # prepared statements kept per connection
+
+
+def execute(conn, sql_command, params=()):
+    """Runs a statement with a server-side prepared cursor.
+
+    The cursor of each statement is kept for the lifetime of the
+    connection, so MySQL parses every statement only once per connection.
+    """
+    cursor = _prepared_cursor(conn, sql_command)
+    cursor.execute(sql_command, tuple(params))
+
+    return cursor
+
+
+def executemany(conn, sql_command, rows):
+    """Runs a statement once per row.  mysql.connector sends INSERTs as a
+    single multi-row statement, which is why it does not use a prepared
+    cursor."""
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany(sql_command, rows)
+        nrows = cursor.rowcount
+    finally:
+        cursor.close()
+
+    return nrows
+
+
+def stream(conn, sql_command, params=(), batch_size=10000):
+    """Yields the rows of a query in batches from an unbuffered cursor."""
+    cursor = conn.cursor(buffered=False)
+
+    try:
+        cursor.execute(sql_command, tuple(params))
+        while(True):
+            rows = cursor.fetchmany(batch_size)
+            if(len(rows) == 0):
+                break
+
+            yield rows
+    finally:
+        cursor.close()
+
+
+# ------------------------------------------------------------------------
+# schema
+# ------------------------------------------------------------------------
+def describe(conn, table):
+    """Columns of a table as tuples (name, type, is primary key)."""
+    cursor = conn.cursor()
+    cursor.execute(f"DESC {fmt_identifier(table)}")
+
+    # obtain columns as an array of tuples (Field, Type, Null, Key, ...)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    return [(row[0], row[1], row[3] == 'PRI') for row in rows]
+
+
+def list_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute("SHOW TABLES")
+
+    # obtain tables as an array of tuples.  Each tuple has length == 1
+    tables = [table[0] for table in cursor.fetchall()]
+    cursor.close()
+
+    return tables
+
+
+def reset_table(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f'DELETE FROM {fmt_identifier(table)}')
+    cursor.execute(f'ALTER TABLE {table} AUTO_INCREMENT = 1')
+    cursor.close()
+
+
+def create_tables(conn):
+    """Runs create-tables.sql in the database of the connection."""
+    with open(SCHEMA_PATH, 'r') as f:
+        script = f.read()
+
+    cursor = conn.cursor()
+    for sql_command in _split_script(script):
+        if(sql_command.upper().startswith('USE ')):
+            continue  # the database is chosen by MYSQL_DATABASE
+        cursor.execute(sql_command)
+    cursor.close()
+
+    conn.commit()
+
+
+def integrity_error():
+    return _mysql().errors.IntegrityError
+
+
+# ------------------------------------------------------------------------
+# partitions
+# ------------------------------------------------------------------------
+def list_partitions(conn, table):
+    """Range partitions of a table as tuples (name, upper bound).
+
+    Returns
+    -------
+    partitions: list
+        Tuples (name, bound) sorted by bound.  bound is the text of the
+        VALUES LESS THAN value, or None for MAXVALUE.  Empty if the table
+        is not partitioned.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT PARTITION_NAME, PARTITION_DESCRIPTION "
+                   "FROM information_schema.PARTITIONS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                   "AND PARTITION_NAME IS NOT NULL "
+                   "ORDER BY PARTITION_ORDINAL_POSITION", (table,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    return [(name, None if bound == 'MAXVALUE' else bound.strip("'"))
+            for name, bound in rows]
+
+
+def add_partitions(conn, table, partitions, catch_all='p_future'):
+    """Splits the catch-all MAXVALUE partition, which should be empty, into
+    new range partitions followed by the catch-all again.
+
+    Parameters
+    ----------
+    partitions: list
+        Tuples (name, bound) with bound as a date or datetime string.
+    """
+    definitions = ', '.join(
+        f"PARTITION {fmt_identifier(name)} VALUES LESS THAN ('{_bound(bound)}')"
+        for name, bound in partitions)
+
+    cursor = conn.cursor()
+    cursor.execute(f'ALTER TABLE {fmt_identifier(table)} '
+                   f'REORGANIZE PARTITION {fmt_identifier(catch_all)} INTO '
+                   f'({definitions}, PARTITION {fmt_identifier(catch_all)} '
+                   f'VALUES LESS THAN (MAXVALUE))')
+    cursor.close()
+
+
+def drop_partition(conn, table, name):
+    """Drops a partition and its rows.  It only changes metadata, so it
+    does not lock the table for long whatever the number of rows."""
+    cursor = conn.cursor()
+    cursor.execute(f'ALTER TABLE {fmt_identifier(table)} '
+                   f'DROP PARTITION {fmt_identifier(name)}')
+    cursor.close()
+
+
+def _bound(bound):
+    """Validated bound of a partition, YYYY-MM-DD[ HH:MM:SS]."""
+    bound = str(bound)
+    if(not re.fullmatch(r'\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?', bound)):
+        raise ValueError(f'Invalid partition bound: {bound!r}')
+
+    return bound
+
+
+def _split_script(script):
+    """Statements of a SQL script without comments."""
+    lines = [line for line in script.splitlines()
+             if not line.strip().startswith('--')]
+
+    return [sql.strip() for sql in '\n'.join(lines).split(';') if sql.strip()]
+
+
+# ------------------------------------------------------------------------
+# connection pool
+# ------------------------------------------------------------------------
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Creates the connection pool on first use.
+
+    Returns
+    -------
+    pool: mysql.connector.pooling.MySQLConnectionPool
+        process-wide connection pool.
+
+    slots: threading.BoundedSemaphore
+        semaphore with one slot per connection in the pool.
+    """
+    global _pool, _pool_slots
+
+    with _pool_lock:
+        if(_pool is None):
+            pool_size = int(os.environ.get('MYSQL_POOL_SIZE', 5))
+
+            _pool = _mysql('pooling').MySQLConnectionPool(
+                pool_name='xerta_bot',
+                pool_size=pool_size,
+                # resetting the session would drop the prepared statements
+                pool_reset_session=False,
+                host=os.environ.get('MYSQL_HOST'),
+                user=os.environ.get('MYSQL_USERNAME'),
+                password=os.environ.get('MYSQL_PASSWORD'),
+                database=os.environ.get('MYSQL_DATABASE')
+            )
+            _pool_slots = threading.BoundedSemaphore(pool_size)
+
+    return _pool, _pool_slots
+
+
+def _prepared_cursor(conn, sql_command):
+    """Prepared cursor of a statement, cached in the connection."""
+    raw = getattr(conn, '_cnx', conn)  # pooled connections wrap the real one
+
+    # statements are lost when the connection is reopened
+    connection_id, cursors = getattr(raw, '_xerta_cursors', (None, None))
+    if(cursors is None or connection_id != raw.connection_id):
+        cursors = {}
+        raw._xerta_cursors = (raw.connection_id, cursors)
+
+    cursor = cursors.get(sql_command)
+    if(cursor is None):
+        if(len(cursors) >= PREPARED_CACHE_SIZE):
+            for old in cursors.values():
+                old.close()
+            cursors.clear()
+
+        cursor = raw.cursor(prepared=True)
+        cursors[sql_command] = cursor
+
+    return cursor
+
+
+def _mysql(submodule=None):
+    """Imports mysql.connector the first time it is needed.
+
+    Parameters
+    ----------
+    submodule: str or None
+        Name of a submodule of mysql.connector, e.g. 'pooling'.
+
+    Returns
+    -------
+    module: module
+        mysql.connector or the submodule.
+    """
+    name = 'mysql.connector' if submodule is None else f'mysql.connector.{submodule}'
+    return importlib.import_module(name)
+
+
+class _PooledConnection:
+    """Pooled connection that frees its pool slot when closed."""
+
+    def __init__(self, conn, slots):
+        self._conn = conn
+        self._slots = slots
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if(self._slots is not None):
+            try:
+                # end the transaction, so the next checkout does not read
+                # the snapshot of this one.  Prepared statements are kept.
+                self._conn.rollback()
+            except _mysql().errors.Error:
+                pass  # the pool pings and reconnects on the next checkout
+
+            try:
+                self._conn.close()
+            finally:
+                self._slots.release()
+                self._slots = None
@@ -0,0 +1,182 @@
+import datetime
+import functools
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+
+# package imports
+from ..formater import fmt_identifier
+
+
+DIALECT = 'sqlite'
+
+SCHEMA_PATH = pathlib.Path(__file__).parent.parent / 'create-tables.sqlite.sql'
+
+
+# dates and datetimes are stored as ISO 8601 text and read back as such
+sqlite3.register_adapter(datetime.datetime, lambda t: t.isoformat(' '))
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_converter('DATE', lambda b: datetime.date.fromisoformat(b.decode()))
+sqlite3.register_converter('DATETIME', lambda b: datetime.datetime.fromisoformat(b.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda b: datetime.datetime.fromisoformat(b.decode()))
+
+
+# ------------------------------------------------------------------------
+# connection
+# ------------------------------------------------------------------------
+def connect():
+    """Checks out a connection to the embedded SQLite database.  It is
+    configured with the following environment variables:
+
+    SQLITE_PATH: database file.  By default 'xerta_bot.sqlite3'.  ':memory:'
+        keeps a database shared by every connection of the process.
+    SQLITE_POOL_SIZE: idle connections kept open.  By default 5.
+
+    The database runs in WAL mode, so readers do not block the writer, and
+    the tables are created the first time the file is opened.  Calling
+    ``conn.close()`` gives the connection back to the pool.
+
+    Returns
+    -------
+    conn: sqlite3.Connection
+        connection with the SQLite database.
+    """
+    try:
+        conn = _idle.get_nowait()
+    except queue.Empty:
+        conn = _open()
+
+    return _PooledConnection(conn)
+
+
+def _open():
+    global _initialized
+
+    path = os.environ.get('SQLITE_PATH', 'xerta_bot.sqlite3')
+    if(path == ':memory:'):
+        path, uri = 'file:xerta_bot?mode=memory&cache=shared', True
+    else:
+        uri = False
+
+    conn = sqlite3.connect(path, uri=uri, timeout=30, check_same_thread=False,
+                           detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+
+    with _init_lock:
+        if(not _initialized):
+            create_tables(conn)
+            _initialized = True
+
+    return conn
+
+
+# ------------------------------------------------------------------------
+# statements
+# ------------------------------------------------------------------------
+def execute(conn, sql_command, params=()):
+    """Runs a statement.  sqlite3 keeps its own cache of compiled
+    statements per connection."""
+    return conn.execute(_translate(sql_command), tuple(params))
+
+
+def executemany(conn, sql_command, rows):
+    cursor = conn.executemany(_translate(sql_command), rows)
+    return cursor.rowcount
+
+
+def stream(conn, sql_command, params=(), batch_size=10000):
+    """Yields the rows of a query in batches."""
+    cursor = conn.execute(_translate(sql_command), tuple(params))
+
+    try:
+        while(True):
+            rows = cursor.fetchmany(batch_size)
+            if(len(rows) == 0):
+                break
+
+            yield rows
+    finally:
+        cursor.close()
+
+
+@functools.lru_cache(maxsize=1024)
+def _translate(sql_command):
+    """Replaces the %s placeholders with the ? of sqlite3."""
+    return sql_command.replace('%s', '?')
+
+
+# ------------------------------------------------------------------------
+# schema
+# ------------------------------------------------------------------------
+def describe(conn, table):
+    """Columns of a table as tuples (name, type, is primary key)."""
+    rows = conn.execute(f'PRAGMA table_info({fmt_identifier(table)})').fetchall()
+
+    if(len(rows) == 0):
+        raise sqlite3.OperationalError(f'no such table: {table}')
+
+    # (cid, name, type, notnull, dflt_value, pk)
+    return [(row[1], row[2], row[5] > 0) for row in rows]
+
+
+def list_tables(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master "
+                        "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall()
+
+    return [row[0] for row in rows]
+
+
+def reset_table(conn, table):
+    conn.execute(f'DELETE FROM {fmt_identifier(table)}')
+    if('sqlite_sequence' in _all_tables(conn)):
+        conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+    conn.commit()
+
+
+def create_tables(conn):
+    """Runs create-tables.sqlite.sql.  Existing tables are kept."""
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+    conn.commit()
+
+
+def integrity_error():
+    return sqlite3.IntegrityError
+
+
+def _all_tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+
+
+# ------------------------------------------------------------------------
+# connection pool
+# ------------------------------------------------------------------------
+_idle = queue.LifoQueue(int(os.environ.get('SQLITE_POOL_SIZE', 5)))
+_initialized = False
+_init_lock = threading.Lock()
+
+
+class _PooledConnection:
+    """Connection that goes back to the pool when closed."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if(self._conn is None):
+            return
+
+        conn, self._conn = self._conn, None
+        conn.rollback()  # discard anything that was not committed
+
+        try:
+            _idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
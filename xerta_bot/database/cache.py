@@ -0,0 +1,134 @@
+import collections
+import sys
+import threading
+import time
+
+
+# ------------------------------------------------------------------------
+# query result cache
+# ------------------------------------------------------------------------
+class ResultCache:
+    """LRU cache of query results, bounded by number of entries, memory and
+    age, that can be invalidated per table.
+
+    Every table has a generation number that is increased when the table is
+    invalidated.  Readers take it before running the query and ``put``
+    refuses results read before the last invalidation, so a slow reader
+    never stores stale rows.
+
+    Parameters
+    ----------
+    max_entries: int
+        Maximum number of results kept.
+
+    ttl: float
+        Seconds a result is valid.
+
+    max_bytes: int
+        Approximate maximum memory used by the results.
+    """
+
+    def __init__(self, max_entries=256, ttl=60.0, max_bytes=16*2**20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self.nbytes = 0
+
+        self._entries = collections.OrderedDict()  # key -> table, expires, size, rows
+        self._tables = collections.defaultdict(set)  # table -> keys
+        self._generations = collections.Counter()  # table -> generation
+        self._epoch = 0  # generation of every table
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """Rows stored under key, or None if they are missing or expired."""
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if(entry is None or entry[1] <= now):
+                if(entry is not None):
+                    self._remove(key)
+                self.stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[3]
+
+    def generation(self, table):
+        with self._lock:
+            return self._epoch, self._generations[table]
+
+    def put(self, key, table, rows, generation, now=None):
+        """Stores rows read from table when its generation was generation."""
+        now = time.monotonic() if now is None else now
+        size = _sizeof(rows)
+
+        if(size > self.max_bytes):
+            return
+
+        with self._lock:
+            if((self._epoch, self._generations[table]) != generation):
+                return  # the table changed while the rows were read
+
+            if(key in self._entries):
+                self._remove(key)
+
+            self._entries[key] = (table, now + self.ttl, size, rows)
+            self._tables[table].add(key)
+            self.nbytes += size
+
+            while(len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate(self, table=None):
+        """Drops the results of a table, or of every table."""
+        with self._lock:
+            if(table is None):
+                self._epoch += 1
+                keys = list(self._entries)
+            else:
+                self._generations[table] += 1
+                keys = list(self._tables.get(table, ()))
+
+            for key in keys:
+                self._remove(key)
+            self.stats['invalidations'] += 1
+
+    def clear(self):
+        self.invalidate()
+
+    def info(self):
+        """Counters, hit rate, number of entries and memory in bytes."""
+        with self._lock:
+            info = dict(self.stats)
+            info['entries'] = len(self._entries)
+            info['bytes'] = self.nbytes
+
+        lookups = info['hits'] + info['misses']
+        info['hit_rate'] = info['hits'] / lookups if lookups else 0.0
+
+        return info
+
+    def _remove(self, key):
+        table, _, size, _ = self._entries.pop(key)
+        self.nbytes -= size
+
+        keys = self._tables[table]
+        keys.discard(key)
+        if(len(keys) == 0):
+            del self._tables[table]
+
+
+def _sizeof(rows):
+    """Approximate memory used by a list of tuples."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+
+    return size
@@ -14,22 +14,51 @@ CREATE TABLE users(
 
 
 -- CREATE COMMANDS TABLE
+-- Partitioned by day so expired days are dropped without deleting rows.
+-- Partitioned tables can not have foreign keys and every unique key must
+-- contain created_at.  The retention job adds the daily partitions.
 CREATE TABLE commands(
-    id INT PRIMARY KEY AUTO_INCREMENT,
+    id INT NOT NULL AUTO_INCREMENT,
     user_id INT NOT NULL,
-    created_at TIMESTAMP DEFAULT NOW(),
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     command VARCHAR(255) NOT NULL,
-    -- SET FOREIGN KEYS
-    FOREIGN KEY(user_id)
-        REFERENCES users(id)
-        ON DELETE CASCADE
+    -- SET PRIMARY KEY
+    PRIMARY KEY(id, created_at),
+    -- SET INDEXES
+    KEY(created_at)
+)
+PARTITION BY RANGE COLUMNS(created_at) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
 );
 
 
 -- CREATE JOKES TABLE
 CREATE TABLE jokes(
     id INT PRIMARY KEY AUTO_INCREMENT,
-    joke VARCHAR(255)
+    joke VARCHAR(255),
     -- SET UNIQUE KEYS
-    UNIQUE KEY(joke),
+    UNIQUE KEY(joke)
+);
+
+
+-- CREATE COMMAND STATS TABLE
+CREATE TABLE command_stats(
+    hour DATETIME NOT NULL,
+    user_id INT NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    total INT NOT NULL DEFAULT 0,
+    -- SET PRIMARY KEY
+    PRIMARY KEY(hour, user_id, command)
+);
+
+
+-- CREATE COMMAND DAILY TABLE
+-- Counts of the raw commands rolled up before they expire
+CREATE TABLE command_daily(
+    day DATE NOT NULL,
+    user_id INT NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    total INT NOT NULL DEFAULT 0,
+    -- SET PRIMARY KEY
+    PRIMARY KEY(day, user_id, command)
 );
\ No newline at end of file
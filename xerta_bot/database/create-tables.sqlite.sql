@@ -0,0 +1,53 @@
+-- CREATE USERS TABLE
+CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY,
+    privilege INTEGER DEFAULT 0,
+    first_name VARCHAR(32),
+    last_name VARCHAR(32),
+    username VARCHAR(32),
+    language_code VARCHAR(32)
+);
+
+
+-- CREATE COMMANDS TABLE
+CREATE TABLE IF NOT EXISTS commands(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    command VARCHAR(255) NOT NULL,
+    -- SET FOREIGN KEYS
+    FOREIGN KEY(user_id)
+        REFERENCES users(id)
+        ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS commands_created_at ON commands(created_at);
+
+
+-- CREATE JOKES TABLE
+CREATE TABLE IF NOT EXISTS jokes(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    joke VARCHAR(255) UNIQUE
+);
+
+
+-- CREATE COMMAND STATS TABLE
+CREATE TABLE IF NOT EXISTS command_stats(
+    hour DATETIME NOT NULL,
+    user_id INTEGER NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    -- SET PRIMARY KEY
+    PRIMARY KEY(hour, user_id, command)
+);
+
+
+-- CREATE COMMAND DAILY TABLE
+CREATE TABLE IF NOT EXISTS command_daily(
+    day DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    -- SET PRIMARY KEY
+    PRIMARY KEY(day, user_id, command)
+);
\ No newline at end of file
@@ -0,0 +1,139 @@
+import csv
+import gzip
+
+
+# ------------------------------------------------------------------------
+# writers
+# ------------------------------------------------------------------------
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def fmt_filename(filename, fmt='csv', compression=None):
+    """Adds the extension of the format and the compression to a filename,
+    unless it already has it.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the output file.
+
+    fmt: str
+        'csv' or 'parquet'.
+
+    compression: str or None
+        None, 'gzip' or 'zstd'.
+
+    Returns
+    -------
+    filename: str
+        Name of the output file with its extension.
+    """
+    extension = EXTENSIONS[fmt]
+    if(fmt == 'csv'):
+        # parquet compresses inside the file, csv compresses the whole file.
+        extension += COMPRESSIONS[compression]
+
+    if(not filename.endswith(extension)):
+        filename += extension
+
+    return filename
+
+
+def open_writer(filename, columns, fmt='csv', compression=None, types=None):
+    """Opens a file to write a table in batches of rows.
+
+    Parameters
+    ----------
+    filename: str
+        Name of the output file.
+
+    columns: list
+        Columns names.
+
+    fmt: str
+        'csv' or 'parquet'.  parquet requires pyarrow.
+
+    compression: str or None
+        None, 'gzip' or 'zstd'.  zstd compressed csv requires zstandard.
+
+    types: dict, optional
+        MySQL type of each column, used to build the parquet schema.
+
+    Returns
+    -------
+    writer: CsvWriter or ParquetWriter
+        Object with write(rows) and close() methods.
+    """
+    if(compression not in COMPRESSIONS):
+        raise ValueError(f'Unknown compression: {compression!r}')
+
+    if(fmt == 'csv'):
+        return CsvWriter(filename, columns, compression)
+    elif(fmt == 'parquet'):
+        return ParquetWriter(filename, columns, compression, types or {})
+    else:
+        raise ValueError(f'Unknown format: {fmt!r}')
+
+
+class CsvWriter:
+    def __init__(self, filename, columns, compression=None):
+        if(compression is None):
+            self._file = open(filename, 'w', newline='')
+        elif(compression == 'gzip'):
+            self._file = gzip.open(filename, 'wt', newline='')
+        else:
+            import zstandard
+            self._file = zstandard.open(filename, 'wt', newline='')
+
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    def __init__(self, filename, columns, compression=None, types=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._columns = list(columns)
+        self._schema = pa.schema([
+            (col, _arrow_type(pa, types.get(col, ''))) for col in self._columns
+        ])
+        self._writer = pq.ParquetWriter(filename, self._schema,
+                                        compression=compression or 'none')
+
+    def write(self, rows):
+        data = {col: list(values) for col, values in zip(self._columns, zip(*rows))}
+        if(len(data) == 0):
+            return
+
+        table = self._pa.Table.from_pydict(data, schema=self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+
+def _arrow_type(pa, mysql_type):
+    """Arrow type equivalent to a MySQL column type."""
+    if(isinstance(mysql_type, bytes)):
+        mysql_type = mysql_type.decode()
+    mysql_type = mysql_type.lower()
+
+    if(mysql_type.startswith(('tinyint', 'smallint', 'mediumint', 'int', 'bigint'))):
+        return pa.int64()
+    elif(mysql_type.startswith(('float', 'double', 'real'))):
+        return pa.float64()
+    elif(mysql_type.startswith(('timestamp', 'datetime'))):
+        return pa.timestamp('us')
+    elif(mysql_type.startswith('date')):
+        return pa.date32()
+    else:
+        return pa.string()
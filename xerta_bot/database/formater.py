@@ -1,4 +1,7 @@
-import numpy as np
+import re
+
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
 
 
 # ------------------------------------------------------------------------
@@ -17,41 +20,34 @@ def fmt_columns(columns):
     columns_string: str
         Formated string with the list of columns.
     """
-    columns_string = str([esc_chars(col) for col in columns])
+    columns_string = ', '.join(fmt_identifier(col) for col in columns)
 
-    # if columns is an numpy array.  Insert the missing commas.
-    if(type(columns) == np.ndarray):
-        columns_string = columns_string.replace(' ', ', ')
+    return columns_string
 
-    # remove every parentheses and quotation mark from the string.
-    for char in ['[', ']', '(', ')', '\'']:
-        columns_string = columns_string.replace(char, '')
 
-    return columns_string
+def fmt_identifier(name):
+    """Checks that a table or column name is a plain identifier.
 
+    Values are never formated into a statement, they are always bound as
+    parameters.  Identifiers cannot be bound, so anything that is not a
+    plain name is rejected.
 
-def fmt_where(**kwargs):
-    """Creates a valid WHERE string statement for MySQL.
+    Parameters
+    ----------
+    name: str
+        Table or column name.
+
+    Returns
+    -------
+    name: str
+        The same name.
+
+    Raises
+    ------
+    ValueError
+        If the name is not a plain identifier.
     """
-    columns = list(kwargs)
-    
-    cond_expr = [None for _ in range(len(columns))]
-    for i, col in enumerate(columns):
-        val = esc_chars(kwargs[col])
-        col = esc_chars(col)
-
-        if(type(val) == str):
-            cond_expr[i] = f'{col}=\'{val}\''
-        else:
-            cond_expr[i] = f'{col}={val}'
-
-    where_string = ' AND '.join(cond_expr)
-    return where_string
-
-
-def esc_chars(s):
-    if(type(s) == str):
-        s = s.replace('\'', '\\\'')
-        s = s.replace('\"', '\\\"')
-    
-    return s
\ No newline at end of file
+    if(not isinstance(name, str) or not _IDENTIFIER.fullmatch(name)):
+        raise ValueError(f'Invalid identifier: {name!r}')
+
+    return name
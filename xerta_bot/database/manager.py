@@ -1,17 +1,42 @@
-import mysql.connector
-import numpy as np
+import contextlib
+import itertools
 import os
-import pandas as pd
+import threading
 
 
 # local modules
-from .formater import fmt_columns, fmt_where
+from .backends import get_backend
+from .cache import ResultCache
+from .exporter import fmt_filename, open_writer
+from .formater import fmt_columns, fmt_identifier
+from . import statements
+from .. import metrics
+
+
+# ------------------------------------------------------------------------
+# schema cache
+# ------------------------------------------------------------------------
+_schemas = {}  # table name -> columns, types and primary key
+
+
+# ------------------------------------------------------------------------
+# query result cache
+# ------------------------------------------------------------------------
+_results = ResultCache(
+    max_entries=int(os.environ.get('QUERY_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('QUERY_CACHE_TTL', 60)),
+    max_bytes=int(os.environ.get('QUERY_CACHE_MAX_BYTES', 16*2**20)),
+)
+
+# tables whose selects are cached unless the call says otherwise
+CACHED_TABLES = {table for table in os.environ.get('QUERY_CACHE_TABLES', '').split(',')
+                 if table}
 
 
 # ------------------------------------------------------------------------
 # generic functions
 # ------------------------------------------------------------------------
-def insert_dataframe(conn, table, df, repeated_entries=True):
+def insert_dataframe(conn, table, df, repeated_entries=True, chunk_size=1000):
     """Insert DataFrame into any table in a MySQL database.
 
     Parameters
@@ -25,20 +50,32 @@ def insert_dataframe(conn, table, df, repeated_entries=True):
     df: list
         DataFrame with the values to be incorporated in the database.
 
+    repeated_entries: bool, optional
+        If False, rows that collide with an existing key are skipped.
+
+    chunk_size: int, optional
+        Number of rows sent in each INSERT statement.
+
     Returns
     -------
     nrows: int
         number of rows inserted to the table.
     """
-    columns = df.columns.values
-    data = np.array(df)
+    import pandas as pd
 
-    nrows = 0
-    for values in data:
-        nrows += insert_row(conn, table, columns, values,
-                            repeated_entries=repeated_entries)
-    
-    return nrows
+    columns = list(df.columns.values)
+
+    # python scalars keep the dtype of each column.  NaN is stored as NULL.
+    rows = (
+        tuple(None if pd.isna(val) else val for val in row)
+        for row in df.itertuples(index=False, name=None)
+    )
+
+    counts = insert_rows(conn, table, columns, rows,
+                         repeated_entries=repeated_entries,
+                         chunk_size=chunk_size)
+
+    return sum(counts)
 
 
 def insert_row(conn, table, columns, values, repeated_entries=True):
@@ -63,20 +100,18 @@ def insert_row(conn, table, columns, values, repeated_entries=True):
     nrows: int
         number of rows inserted to the table.
     """
-    columns_str = fmt_columns(columns)
+    check_columns(conn, table, columns)
+
     values = tuple(values)  # values must be a tuple
 
     # MySQL command
-    sql_command = f'INSERT INTO {table} ({columns_str}) VALUES (' + \
-        ', '.join(['%s']*len(columns)) + \
-        ')'
+    sql_command = statements.insert_sql(table, tuple(columns))
 
     # MySQL interaction
-    cursor = conn.cursor()
-
     try:
-        cursor.execute(sql_command, values)
-        conn.commit()
+        execute(conn, sql_command, values)
+        commit(conn)
+        invalidate_cache(table)
     
         nrows = 1
 
@@ -94,10 +129,190 @@ def insert_row(conn, table, columns, values, repeated_entries=True):
         #     nrows = 1
         # else:
         #     nrows = 0
-    except mysql.connector.errors.IntegrityError:
+    except get_backend().integrity_error():
         nrows = 0
 
-    cursor.close()
+    return nrows
+
+
+def insert_rows(conn, table, columns, rows, repeated_entries=True,
+                chunk_size=1000, commit=True):
+    """Insert many rows of data in chunks inside a single transaction.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+
+    columns: list
+        Columns that are going to be used to insert data
+
+    rows: iterable
+        Tuples with the values of each row.  It is consumed lazily, so a
+        generator keeps the memory bounded by chunk_size.
+
+    repeated_entries: bool, optional
+        If False, rows that collide with an existing key are skipped with
+        INSERT IGNORE.
+
+    chunk_size: int, optional
+        Number of rows sent in each INSERT statement.
+
+    commit: bool, optional
+        If False the transaction is left open, so the caller can write more
+        rows and commit everything at once.  It is still rolled back on
+        error.
+
+    Returns
+    -------
+    counts: list
+        number of rows inserted by each chunk.
+    """
+    check_columns(conn, table, columns)
+
+    backend = get_backend()
+
+    # MySQL command
+    sql_command = statements.insert_sql(table, tuple(columns),
+        ignore=not repeated_entries, dialect=backend.DIALECT)
+
+    # MySQL interaction.  executemany sends each chunk as a multi-row INSERT.
+    rows = iter(rows)
+    counts = []
+
+    try:
+        while(True):
+            chunk = [tuple(row) for row in itertools.islice(rows, chunk_size)]
+            if(len(chunk) == 0):
+                break
+
+            counts.append(backend.executemany(conn, sql_command, chunk))
+            metrics.db_round_trip()
+
+        if(commit):
+            _commit(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        invalidate_cache(table)
+
+    return counts
+
+
+def upsert_row(conn, table, columns, values, keys=None):
+    """Insert a row, or update it if a row with the same keys exists, with a
+    single statement.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+
+    columns: list
+        Columns that are going to be used to insert data
+
+    values: list
+        Values that are going to be inserted in the database
+
+    keys: list, optional
+        Columns of the primary or unique key.  They are not updated.  By
+        default the primary key of the table.
+
+    Returns
+    -------
+    nrows: int
+        1 if the row was inserted, 2 if it was updated and 0 if it already
+        had the same values.  SQLite returns 1 in every case.
+    """
+    check_columns(conn, table, columns)
+    if(keys is None):
+        keys = get_schema(conn, table)['primary_key']
+
+    values = tuple(values)  # values must be a tuple
+
+    # MySQL command
+    sql_command = statements.upsert_sql(table, tuple(columns), tuple(keys),
+                                        dialect=get_backend().DIALECT)
+
+    # MySQL interaction
+    cursor = execute(conn, sql_command, values)
+    commit(conn)
+    invalidate_cache(table)
+
+    nrows = cursor.rowcount
+
+    return nrows
+
+
+def upsert_rows(conn, table, columns, rows, keys=None, increment=(),
+                commit=True):
+    """Insert many rows, or update the ones whose keys already exist, with a
+    single statement and commit.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+
+    columns: list
+        Columns that are going to be used to insert data
+
+    rows: list
+        List of tuples with the values of each row.
+
+    keys: list, optional
+        Columns of the primary or unique key.  They are not updated.  By
+        default the primary key of the table.
+
+    increment: list, optional
+        Columns whose new value is added to the existing one instead of
+        replacing it.  Useful for counters.
+
+    commit: bool, optional
+        If False the transaction is left open, so the caller can write more
+        rows and commit everything at once.  It is still rolled back on
+        error.
+
+    Returns
+    -------
+    nrows: int
+        number of rows affected as reported by MySQL.
+    """
+    if(len(rows) == 0):
+        return 0
+
+    check_columns(conn, table, columns)
+    if(keys is None):
+        keys = get_schema(conn, table)['primary_key']
+
+    backend = get_backend()
+
+    # MySQL command
+    sql_command = statements.upsert_sql(table, tuple(columns), tuple(keys),
+                                        tuple(increment), backend.DIALECT)
+
+    # MySQL interaction
+    try:
+        nrows = backend.executemany(conn, sql_command, [tuple(row) for row in rows])
+        metrics.db_round_trip()
+        if(commit):
+            _commit(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        invalidate_cache(table)
+
     return nrows
 
 
@@ -127,23 +342,17 @@ def update_column(conn, table, column, value, **kwargs):
     nrows: int
         number of rows inserted to the table.
     """
-    # MySQL interaction
-    cursor = conn.cursor()
+    check_columns(conn, table, [column, *kwargs])
 
-    # execute MySQL command
-    if(len(kwargs) > 0):
-        where_str = fmt_where(**kwargs)
-        sql_command = f'UPDATE {table} SET {column}=%s WHERE {where_str}'
-    else:
-        sql_command = f'UPDATE {table} SET {column}=%s'
+    # MySQL command.  The WHERE values are bound as parameters.
+    sql_command = statements.update_sql(table, column, tuple(kwargs))
 
-    cursor.execute(sql_command, (value,))
-    conn.commit()
+    # MySQL interaction
+    cursor = execute(conn, sql_command, (value, *kwargs.values()))
+    commit(conn)
+    invalidate_cache(table)
     
     nrows = cursor.rowcount
-    
-    # close interaction
-    cursor.close()
 
     return nrows
 
@@ -163,17 +372,21 @@ def delete_values(conn, table, **kwargs):
         arguments that are going to be used to determine WHERE the
         data will be deleted.
     """    
-    cursor = conn.cursor()
-    if(len(kwargs) > 0):
-        where_str = fmt_where(**kwargs)
-        cursor.execute(f'DELETE FROM {table} WHERE {where_str}')
-    else:
-        cursor.execute(f'DELETE FROM {table}')
-    conn.commit()
+    check_columns(conn, table, kwargs)
+
+    sql_command = statements.delete_sql(table, tuple(kwargs))
+
+    execute(conn, sql_command, tuple(kwargs.values()))
+    commit(conn)
+    invalidate_cache(table)
 
 
 def export_table(conn, table, **kwargs):
-    """Exports a table from the database to a csv file.
+    """Exports a table from the database to a csv or parquet file.
+
+    The rows are read in batches from an unbuffered cursor and written as
+    they arrive, so the memory used does not depend on the size of the
+    table.
 
     Parameters
     ----------
@@ -184,24 +397,81 @@ def export_table(conn, table, **kwargs):
         Table name inside the dataframe.
 
     filename: str, optional
-        filename of the csv table.  By default it is the table name.
+        filename of the exported table.  By default it is the table name.
     
     columns: list, optional
         List with columns names.  By default it takes every column in the table.
 
-    where: str, optional
-        Conditional expression that must be satisfied.
+    where: dict, optional
+        Values that the columns must be equal to.
+
+    since: datetime.datetime, optional
+        Export only the rows with time_column greater or equal than since.
+
+    until: datetime.datetime, optional
+        Export only the rows with time_column lower than until.
+
+    time_column: str, optional
+        Column used by since and until.  By default 'created_at'.
+
+    format: str, optional
+        'csv' or 'parquet'.  By default 'csv'.
+
+    compression: str, optional
+        None, 'gzip' or 'zstd'.  By default None.
+
+    batch_size: int, optional
+        Number of rows read from the server at a time.  By default 10000.
+
+    Returns
+    -------
+    nrows: int
+        number of rows exported.
     """
-    columns = kwargs.get('columns', get_columns(conn, table))
-    where = kwargs.get('where', None)
-    filename = kwargs.get('filename', table)
+    columns = kwargs.get('columns', None)
+    where = kwargs.get('where', None) or {}
+    since = kwargs.get('since', None)
+    until = kwargs.get('until', None)
+    time_column = kwargs.get('time_column', 'created_at')
+    fmt = kwargs.get('format', 'csv')
+    compression = kwargs.get('compression', None)
+    batch_size = kwargs.get('batch_size', 10000)
+    filename = fmt_filename(kwargs.get('filename', table), fmt, compression)
+
+    if(columns is None):
+        columns = get_columns(conn, table)
+    check_columns(conn, table, [*columns, *where])
+
+    # conditions with bound values
+    conditions = [f'{col} = %s' for col in where]
+    params = list(where.values())
+    if(since is not None or until is not None):
+        check_columns(conn, table, [time_column])
+    if(since is not None):
+        conditions.append(f'{time_column} >= %s')
+        params.append(since)
+    if(until is not None):
+        conditions.append(f'{time_column} < %s')
+        params.append(until)
+
+    sql_command = f'SELECT {fmt_columns(columns)} FROM {table}'
+    if(len(conditions) > 0):
+        sql_command += ' WHERE ' + ' AND '.join(conditions)
+
+    types = get_schema(conn, table)['types']
+    writer = open_writer(filename, columns, fmt, compression, types)
+
+    # MySQL interaction.  An unbuffered cursor streams the rows.
+    nrows = 0
 
-    df = get_table(conn, table, columns=columns, where=where)
-    
-    if(filename[-4:] == ".csv"):
-        df.to_csv(filename)
-    else:
-        df.to_csv(f'{filename}.csv')
+    try:
+        for rows in stream(conn, sql_command, params, batch_size):
+            writer.write(rows)
+            nrows += len(rows)
+    finally:
+        writer.close()
+
+    return nrows
 
 
 def get_table(conn, table, **kwargs):
@@ -218,41 +488,273 @@ def get_table(conn, table, **kwargs):
     columns: list, optional
         List with columns names.  By default it takes every column in the table.
 
-    where: str, optional
-        Conditional expression that must be satisfied.
+    where: dict, optional
+        Values that the columns must be equal to.
+
+    cache: bool, optional
+        Whether to use the query result cache.  See select.
 
     Returns
     -------
-    df: np.ndarray
-        Array with the data from the MySQL table.
+    df: pd.DataFrame
+        DataFrame with the data from the MySQL table.
     """
-    columns = kwargs.get('columns', get_columns(conn, table))
+    columns = kwargs.get('columns', None)
     where = kwargs.get('where', None)
+    cache = kwargs.get('cache', None)
 
-    # format columns as a string
-    columns_str = fmt_columns(columns)
+    if(columns is None):
+        columns = get_columns(conn, table)
 
-    # MySQL interaction
-    cursor = conn.cursor()
+    import pandas as pd
 
-    if(where is None):
-         # obtain every column from the table
-        sql_command = f'SELECT {columns_str} FROM {table}'
-    elif(type(where) == dict):
-        where_str = fmt_where(**where)
-        
-        # obtain the colums of the rows where the condition is satisfied
-        sql_command = f'SELECT {columns_str} FROM {table} WHERE {where_str}'
-    else:
-        raise TypeError('\'where\' must be a dict or None.')
-    
-    cursor.execute(sql_command)
-    data = cursor.fetchall()
+    data = select(conn, table, columns, where=where, cache=cache)
     df = pd.DataFrame(data, columns=columns)
 
     return df
 
 
+def select(conn, table, columns, where=None, order_by=None, limit=None,
+           offset=None, cache=None):
+    """Get rows of a table as a list of tuples.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+    
+    columns: list
+        List with columns names.
+
+    where: dict, optional
+        Values that the columns must be equal to.
+
+    order_by: list, optional
+        Columns used to sort the rows.
+
+    limit: int, optional
+        Maximum number of rows.
+
+    offset: int, optional
+        Number of rows skipped before the first one returned.
+
+    cache: bool, optional
+        Whether to read the rows from the query result cache and store them
+        there.  By default only the tables listed in the QUERY_CACHE_TABLES
+        environment variable are cached.  The writes made through this
+        module invalidate the results of their table; the ones made with
+        execute do not.
+
+    Returns
+    -------
+    rows: list
+        List of tuples with the values of the columns.
+    """
+    if(cache is None):
+        cache = table in CACHED_TABLES
+
+    if(cache):
+        key = (table, tuple(columns), tuple(sorted((where or {}).items())),
+               tuple(order_by or ()), limit, offset)
+
+        rows = _results.get(key)
+        if(rows is not None):
+            return list(rows)
+
+        generation = _results.generation(table)
+        rows = select(conn, table, columns, where, order_by, limit, offset, cache=False)
+        _results.put(key, table, tuple(rows), generation)
+
+        return rows
+
+    check_columns(conn, table, columns)
+
+    if(where is None):
+        where = {}
+    elif(type(where) != dict):
+        raise TypeError('\'where\' must be a dict or None.')
+    check_columns(conn, table, where)
+
+    if(order_by is None):
+        order_by = ()
+    check_columns(conn, table, order_by)
+
+    # MySQL command.  The WHERE values and limits are bound as parameters.
+    sql_command = statements.select_sql(table, tuple(columns), tuple(where),
+        tuple(order_by), limit is not None, limit is not None and offset is not None)
+
+    params = list(where.values())
+    if(limit is not None):
+        params.append(int(limit))
+        if(offset is not None):
+            params.append(int(offset))
+
+    rows = query(conn, sql_command, params)
+
+    return rows
+
+
+def select_dicts(conn, table, columns, **kwargs):
+    """Get rows of a table as a list of dicts.  It takes the same arguments
+    as select.
+
+    Returns
+    -------
+    rows: list
+        List of dicts from column name to value.
+    """
+    rows = select(conn, table, columns, **kwargs)
+
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def count_rows(conn, table, where=None):
+    """Number of rows of a table.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+
+    where: dict, optional
+        Values that the columns must be equal to.
+
+    Returns
+    -------
+    nrows: int
+        number of rows that satisfy the condition.
+    """
+    where = where or {}
+    check_columns(conn, table, where)
+
+    sql_command = statements.count_sql(table, tuple(where))
+    nrows = query(conn, sql_command, tuple(where.values()))[0][0]
+
+    return nrows
+
+
+def query(conn, sql_command, params=()):
+    """Runs a statement that returns rows.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    sql_command: str
+        Statement with a %s placeholder for each parameter.
+
+    params: tuple, optional
+        Values bound to the placeholders.
+
+    Returns
+    -------
+    rows: list
+        List of tuples.
+    """
+    cursor = get_backend().execute(conn, sql_command, params)
+    rows = cursor.fetchall()
+    metrics.db_round_trip(len(rows))
+
+    return rows
+
+
+def execute(conn, sql_command, params=()):
+    """Runs a statement with a server-side prepared cursor.
+
+    The cursor of each statement is kept for the lifetime of the
+    connection, so the database parses every statement only once per
+    connection.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    sql_command: str
+        Statement with a %s placeholder for each parameter.
+
+    params: tuple, optional
+        Values bound to the placeholders.
+
+    Returns
+    -------
+    cursor: mysql.connector.cursor.MySQLCursorPrepared
+        cursor that executed the statement.
+    """
+    cursor = get_backend().execute(conn, sql_command, params)
+    metrics.db_round_trip()
+
+    return cursor
+
+
+def stream(conn, sql_command, params=(), batch_size=10000):
+    """Runs a query and yields its rows in batches, without loading every
+    row in memory.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    sql_command: str
+        Statement with a %s placeholder for each parameter.
+
+    params: tuple, optional
+        Values bound to the placeholders.
+
+    batch_size: int, optional
+        Number of rows in each batch.
+
+    Yields
+    ------
+    rows: list
+        List of at most batch_size tuples.
+    """
+    metrics.db_round_trip()
+    for rows in get_backend().stream(conn, sql_command, params, batch_size):
+        metrics.db_rows_fetched(len(rows))
+        yield rows
+
+
+def commit(conn):
+    """Commits the current transaction of a connection.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+    """
+    conn.commit()
+    metrics.db_commit()
+
+
+_commit = commit  # for the functions that have a commit parameter
+
+
+def invalidate_cache(table=None):
+    """Drops the cached results of a table.
+
+    Parameters
+    ----------
+    table: str, optional
+        Table name inside the database.  By default every table.
+    """
+    _results.invalidate(table)
+
+
+def cache_stats():
+    """Hits, misses, hit rate, evictions, invalidations, number of entries
+    and approximate memory in bytes of the query result cache."""
+    return _results.info()
+
+
 def get_columns(conn, table):
     """Get every column from a table in database.
 
@@ -269,18 +771,85 @@ def get_columns(conn, table):
     columns: list
         List with columns names.
     """    
-    cursor = conn.cursor()
-    cursor.execute(f"DESC {table}")
-
-    # obtain tables as an array of tuples.
-    tables = cursor.fetchall()
-    
-    # extract the table name from the tuple.
-    columns = [row[0] for row in tables]
+    columns = list(get_schema(conn, table)['columns'])
 
     return columns
 
 
+def get_schema(conn, table):
+    """Get the columns, types and primary key of a table.
+
+    The schema of each table is read from the database only the first time
+    and then kept in memory until refresh_schema is called.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+
+    Returns
+    -------
+    schema: dict
+        'columns' with the columns names in order, 'types' with the type of
+        each column and 'primary_key' with the columns of the primary key.
+    """
+    schema = _schemas.get(table)
+    if(schema is not None):
+        return schema
+
+    # obtain columns as an array of tuples (name, type, is primary key)
+    rows = get_backend().describe(conn, fmt_identifier(table))
+    metrics.db_round_trip(len(rows))
+
+    schema = {
+        'columns': tuple(row[0] for row in rows),
+        'types': {row[0]: row[1] for row in rows},
+        'primary_key': [row[0] for row in rows if row[2]],
+    }
+    schema['column_set'] = frozenset(schema['columns'])
+
+    _schemas[table] = schema
+    return schema
+
+
+def check_columns(conn, table, columns):
+    """Raises ValueError if any column does not belong to the table.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    table: str
+        Table name inside the database.
+
+    columns: list
+        Columns names to be checked.
+    """
+    column_set = get_schema(conn, table)['column_set']
+
+    unknown = [col for col in columns if col not in column_set]
+    if(len(unknown) > 0):
+        raise ValueError(f'Unknown columns in table {table}: {unknown}')
+
+
+def refresh_schema(table=None):
+    """Forgets the cached schema of a table so it is read again on next use.
+
+    Parameters
+    ----------
+    table: str or None
+        Table name inside the database.  By default every table.
+    """
+    if(table is None):
+        _schemas.clear()
+    else:
+        _schemas.pop(table, None)
+
+
 def reset_table(conn, table):
     """Resets every entry from a particular table.
 
@@ -292,9 +861,10 @@ def reset_table(conn, table):
     table: str
         Table name inside the dataframe.
     """    
-    cursor = conn.cursor()
-    cursor.execute(f'DELETE FROM {table}')
-    cursor.execute(f'ALTER TABLE {table} AUTO_INCREMENT = 1')
+    get_backend().reset_table(conn, table)
+
+    refresh_schema(table)
+    invalidate_cache(table)
 
 
 def get_tables(conn):
@@ -310,59 +880,70 @@ def get_tables(conn):
     tables: list
         List with table names.
     """
-    cursor = conn.cursor()
-    cursor.execute("SHOW TABLES")
-
-    # obtain tables as an array of tuples.  Each tuple has length == 1
-    tables = cursor.fetchall()
-    
-    # extract the table name from the tuple.
-    tables = [table[0] for table in tables]
+    tables = get_backend().list_tables(conn)
 
     return tables
 
 
-def connect():
-    """Stablishes a connection with the MySQL server.  To assign every
-    parameter, the following scheme should be followed:
-
-    import os
-    
-    os.environ['MYSQL_HOST'] = 'localhost'
-    os.environ['MYSQL_USER'] = 'username'
-    os.environ['MYSQL_PASSWORD'] = 'pass1234'
-    os.environ['MYSQL_DATABASE'] = 'dabase_name'
+def create_tables(conn):
+    """Creates the users, commands, jokes and command_stats tables.
 
     Parameters
     ----------
-    MYSQL_HOST: str
-        MySQL host.
-    
-    MYSQL_USERNAME: str
-        MySQL username.
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+    """
+    get_backend().create_tables(conn)
+    refresh_schema()
 
-    MYSQL_PASSWORD: str
-        MySQL password.
 
-    MYSQL_DATABASE: str
-        Database name.
+def connect():
+    """Checks out a connection from the storage backend selected with the
+    XERTA_DB_BACKEND environment variable: 'mysql' (default) or 'sqlite'.
+    See xerta_bot.database.backends for the variables of each one.
+
+    Calling ``conn.close()`` gives the connection back to the pool.  Prefer
+    ``connection()`` which does that automatically.
 
     Returns
     -------
-    conn: mysql.connector.connection_cext.CMySQLConnection
+    conn: mysql.connector.pooling.PooledMySQLConnection or sqlite3.Connection
+        connection with the database.
+    """
+    conn = get_backend().connect()
+    metrics.db_connect()
+
+    return conn
+
+
+@contextlib.contextmanager
+def connection():
+    """Context manager that shares one pooled connection per thread.
+
+    Nested ``with connection() as conn`` blocks in the same thread reuse
+    the connection checked out by the outermost block, which gives it back
+    to the pool on exit.
+
+    Yields
+    ------
+    conn: mysql.connector.pooling.PooledMySQLConnection
         connection with MySQL server.
     """
-    host = os.environ.get('MYSQL_HOST')
-    user = os.environ.get('MYSQL_USERNAME')
-    password = os.environ.get('MYSQL_PASSWORD')
-    database = os.environ.get('MYSQL_DATABASE')
-
-    # stablish connection
-    conn = mysql.connector.connect(
-        host=host,
-        user=user,
-        password=password,
-        database=database
-    )
+    conn = getattr(_local, 'conn', None)
+    if(conn is not None):
+        yield conn
+        return
 
-    return conn
\ No newline at end of file
+    conn = connect()
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        conn.close()
+
+
+# ------------------------------------------------------------------------
+# connection per thread
+# ------------------------------------------------------------------------
+_local = threading.local()
@@ -0,0 +1,200 @@
+import collections
+import datetime
+import os
+import threading
+import time
+
+# package imports
+from .. import manager
+
+
+# --------------------------------------------------------------------------------
+# rollups
+# --------------------------------------------------------------------------------
+ANALYTICS_HOURS = int(os.environ.get('ANALYTICS_HOURS', 48))  # hours kept in memory
+
+# seconds after which the rollups are read again from command_stats, so the
+# commands recorded by other processes are counted.  0 reads them only once.
+ANALYTICS_RELOAD_TTL = float(os.environ.get('ANALYTICS_RELOAD_TTL', 0))
+
+_by_command = collections.Counter()  # command -> uses
+_by_user = collections.Counter()  # user id -> uses
+_by_hour = collections.OrderedDict()  # hour -> Counter of commands
+_loaded = False
+_loaded_at = None
+_lock = threading.RLock()
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def update_rollups(conn, rows):
+    """Adds recorded commands to the rollups.
+
+    The counts per hour, user and command are added to the command_stats
+    table and to the totals kept in memory.  The raw commands table is
+    never read.  The commit also covers anything the caller wrote before in
+    the same transaction, and the totals in memory only change after it.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    rows: list
+        Tuples (user_id, command, created_at).
+    """
+    counts = collections.Counter(
+        (_hour(created_at), int(user_id), command)
+        for user_id, command, created_at in rows
+    )
+
+    manager.upsert_rows(conn, 'command_stats',
+        ['hour', 'user_id', 'command', 'total'],
+        [(*key, total) for key, total in counts.items()],
+        increment=['total']
+    )
+
+    with _lock:
+        if(not _loaded):
+            # the rows just written are part of what is loaded
+            load_rollups(conn)
+            return
+
+        for (hour, user_id, command), total in counts.items():
+            _by_command[command] += total
+            _by_user[user_id] += total
+            _by_hour.setdefault(hour, collections.Counter())[command] += total
+
+        _trim_hours()
+
+
+def load_rollups(conn):
+    """Reads the totals kept in memory from the command_stats table.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+    """
+    global _loaded, _loaded_at
+
+    since = _hour(datetime.datetime.now()) - datetime.timedelta(hours=ANALYTICS_HOURS)
+
+    rows = manager.query(conn,
+        'SELECT command, SUM(total) FROM command_stats GROUP BY command')
+    by_command = collections.Counter({cmd: int(n) for cmd, n in rows})
+
+    rows = manager.query(conn,
+        'SELECT user_id, SUM(total) FROM command_stats GROUP BY user_id')
+    by_user = collections.Counter({user: int(n) for user, n in rows})
+
+    rows = manager.query(conn,
+        'SELECT hour, command, SUM(total) FROM command_stats '
+        'WHERE hour >= %s GROUP BY hour, command ORDER BY hour', (since,))
+    by_hour = collections.OrderedDict()
+    for hour, command, total in rows:
+        by_hour.setdefault(hour, collections.Counter())[command] = int(total)
+
+    with _lock:
+        _by_command.clear()
+        _by_command.update(by_command)
+        _by_user.clear()
+        _by_user.update(by_user)
+        _by_hour.clear()
+        _by_hour.update(by_hour)
+        _loaded = True
+        _loaded_at = time.monotonic()
+
+
+def top_commands(conn, n=10):
+    """Most used commands.
+
+    Returns
+    -------
+    commands: list
+        Tuples (command, uses) sorted by uses.
+    """
+    with _lock:
+        _ensure_loaded(conn)
+        return _by_command.most_common(n)
+
+
+def top_users(conn, n=10):
+    """Users that used the most commands.
+
+    Returns
+    -------
+    users: list
+        Tuples (user_id, uses) sorted by uses.
+    """
+    with _lock:
+        _ensure_loaded(conn)
+        return _by_user.most_common(n)
+
+
+def user_total(conn, user_id):
+    """Number of commands used by a user."""
+    with _lock:
+        _ensure_loaded(conn)
+        return _by_user[int(user_id)]
+
+
+def total_commands(conn):
+    """Number of commands used by every user."""
+    with _lock:
+        _ensure_loaded(conn)
+        return sum(_by_command.values())
+
+
+def hourly_counts(conn, hours=24, command=None):
+    """Uses per hour during the last hours.
+
+    Parameters
+    ----------
+    hours: int
+        Number of hours, at most ANALYTICS_HOURS.
+
+    command: str or None
+        Count only this command.  By default every command.
+
+    Returns
+    -------
+    counts: list
+        Tuples (hour, uses) from the oldest to the current hour.
+    """
+    now = _hour(datetime.datetime.now())
+    hours = min(hours, ANALYTICS_HOURS)
+
+    with _lock:
+        _ensure_loaded(conn)
+
+        counts = []
+        for i in range(hours - 1, -1, -1):
+            hour = now - datetime.timedelta(hours=i)
+            bucket = _by_hour.get(hour, {})
+
+            if(command is None):
+                counts.append((hour, sum(bucket.values())))
+            else:
+                counts.append((hour, bucket.get(command, 0)))
+
+    return counts
+
+
+def _ensure_loaded(conn):
+    expired = (ANALYTICS_RELOAD_TTL > 0 and _loaded_at is not None and
+               time.monotonic() - _loaded_at >= ANALYTICS_RELOAD_TTL)
+
+    if(not _loaded or expired):
+        load_rollups(conn)
+
+
+def _trim_hours():
+    since = _hour(datetime.datetime.now()) - datetime.timedelta(hours=ANALYTICS_HOURS)
+    for hour in [hour for hour in _by_hour if hour < since]:
+        del _by_hour[hour]
+
+
+def _hour(t):
+    return t.replace(minute=0, second=0, microsecond=0)
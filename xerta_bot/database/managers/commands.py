@@ -1,9 +1,16 @@
-import pandas as pd
-import pathlib
-import sqlite3
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
 
 # package imports    
 from .. import manager
+from . import analytics
+
+
+logger = logging.getLogger(__name__)
 
 
 # --------------------------------------------------------------------------------
@@ -54,4 +61,194 @@ def insert_command(conn, user_id, command):
         [user_id, command]
     )
 
-    return nrows
\ No newline at end of file
+    return nrows
+
+
+def record_command(user_id, command):
+    """Records the use of a command.
+
+    If the audit writer is running the row is queued and written in the
+    background.  Otherwise it is inserted right away.
+
+    Parameters
+    ----------
+    user_id: int
+        Telegram id of the user
+
+    command: str
+        Name of the command being used
+
+    Returns
+    -------
+    recorded: bool
+        False if the row was dropped because the queue is full.
+    """
+    if(_writer is not None):
+        return _writer.record(user_id, command)
+
+    rows = [(user_id, command, datetime.datetime.now())]
+    with manager.connection() as conn:
+        write_commands(conn, rows)
+
+    return True
+
+
+def write_commands(conn, rows):
+    """Inserts commands and adds them to the rollups in one transaction, so
+    command_stats never misses a command that was written.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    rows: list
+        Tuples (user_id, command, created_at).
+    """
+    manager.insert_rows(conn, 'commands', ['user_id', 'command', 'created_at'],
+                        rows, commit=False)
+    analytics.update_rollups(conn, rows)  # commits both
+
+
+# --------------------------------------------------------------------------------
+# audit writer
+# --------------------------------------------------------------------------------
+_writer = None
+
+
+def start_audit_writer():
+    """Starts the background writer of the commands table.  It is configured
+    with the following environment variables:
+
+    AUDIT_QUEUE_SIZE: maximum number of pending rows.  By default 10000.
+    AUDIT_BATCH_SIZE: rows written per INSERT.  By default 100.
+    AUDIT_FLUSH_INTERVAL: milliseconds between flushes.  By default 500.
+    AUDIT_PUT_TIMEOUT: milliseconds to wait for room in a full queue
+        before dropping the row.  By default 0.
+
+    Returns
+    -------
+    writer: AuditWriter
+        running audit writer.
+    """
+    global _writer
+
+    if(_writer is None):
+        _writer = AuditWriter(
+            maxsize=int(os.environ.get('AUDIT_QUEUE_SIZE', 10000)),
+            batch_size=int(os.environ.get('AUDIT_BATCH_SIZE', 100)),
+            flush_interval=float(os.environ.get('AUDIT_FLUSH_INTERVAL', 500)) / 1e3,
+            put_timeout=float(os.environ.get('AUDIT_PUT_TIMEOUT', 0)) / 1e3
+        )
+        _writer.start()
+
+    return _writer
+
+
+def stop_audit_writer(timeout=None):
+    """Writes every pending row and stops the background writer.
+
+    Parameters
+    ----------
+    timeout: float or None
+        Seconds to wait for the pending rows to be written.
+    """
+    global _writer
+
+    if(_writer is not None):
+        _writer.stop(timeout)
+        _writer = None
+
+
+class AuditWriter:
+    """Writes commands to the database in batches from a background thread.
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of rows waiting to be written.
+
+    batch_size: int
+        Rows are flushed as soon as this many are pending.
+
+    flush_interval: float
+        Seconds after which pending rows are flushed even if the batch is
+        not full.
+
+    put_timeout: float
+        Seconds to wait for room in a full queue before dropping the row.
+    """
+
+    def __init__(self, maxsize=10000, batch_size=100, flush_interval=0.5,
+                 put_timeout=0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='audit-writer',
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def record(self, user_id, command):
+        row = (user_id, command, datetime.datetime.now())
+
+        try:
+            if(self.put_timeout > 0):
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning('Audit queue is full.  Dropped command %s.', command)
+            return False
+
+        self._count('queued')
+        return True
+
+    def _run(self):
+        while(not self._stop.is_set() or not self._queue.empty()):
+            rows = self._collect()
+            if(len(rows) > 0):
+                self._flush(rows)
+
+    def _collect(self):
+        """Waits until a batch is full or the flush interval is over."""
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while(len(rows) < self.batch_size):
+            remaining = deadline - time.monotonic()
+            if(remaining <= 0 or (self._stop.is_set() and self._queue.empty())):
+                break
+
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return rows
+
+    def _flush(self, rows):
+        try:
+            with manager.connection() as conn:
+                write_commands(conn, rows)
+            self._count('written', len(rows))
+        except Exception:
+            self._count('failed', len(rows))
+            logger.exception('Could not write %d commands.', len(rows))
+
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
\ No newline at end of file
@@ -1,30 +1,271 @@
-import pathlib
-import numpy as np
+import array
+import bisect
+import collections
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
 
 # package imports
 from .. import manager
 
 
+logger = logging.getLogger(__name__)
+
+JOKE_MAX_LENGTH = 255  # size of the joke column
+
+# --------------------------------------------------------------------------------
+# joke id index
+# --------------------------------------------------------------------------------
+_joke_ids = array.array('L')
+_last_id = 0
+_loaded = False
+_lock = threading.Lock()
+
+# inverted index: token -> sorted ids of the jokes that contain it
+_postings = collections.defaultdict(lambda: array.array('L'))
+
+TOKEN_PATTERN = re.compile(r'\w+')
+TOKEN_MIN_LENGTH = 2
+
+
 # --------------------------------------------------------------------------------
 # functions
 # --------------------------------------------------------------------------------
-def random_joke(conn):
+def random_joke(conn, query=None):
     """Extract a random joke from the database.
 
+    Only the ids of the jokes are kept in memory.  The chosen joke is
+    fetched by primary key, so the cost does not depend on the size of the
+    jokes table.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    query: str, optional
+        Words the joke must contain.  See search_jokes.  A query without
+        any word that can be searched, e.g. only numbers or single letters,
+        is ignored and any joke can be chosen.
+
+    Returns
+    -------
+    joke: str or None
+        Random joke from jokes table in database.  None if the table is
+        empty or no joke matches the query.
+    """
+    if(not _loaded):
+        refresh_joke_ids(conn)
+
+    if(query is not None and len(tokenize(query)) == 0):
+        query = None
+
+    while(True):
+        if(query is None):
+            joke_id = random.choice(_joke_ids) if len(_joke_ids) > 0 else None
+        else:
+            joke_id = _random_match(conn, query)
+
+        if(joke_id is None):
+            return None
+
+        joke = get_joke(conn, joke_id)
+
+        if(joke is not None):
+            return joke
+
+        # the joke was deleted from the table.  Forget its id.
+        _forget_joke(joke_id, tokenize(query or ''))
+
+
+def search_jokes(conn, query):
+    """Ids of the jokes that contain every word of a query.
+
+    Words are matched whole, ignoring case and accents, with an in-memory
+    inverted index, so the database is not read.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    query: str
+        Words separated by spaces.
+
+    Returns
+    -------
+    ids: array.array or list
+        Sorted ids of the matching jokes.  Empty if the query has no words.
+    """
+    if(not _loaded):
+        refresh_joke_ids(conn)
+
+    tokens = tokenize(query)
+    if(len(tokens) == 0):
+        return []
+
+    with _lock:
+        postings = _sorted_postings(tokens)
+
+        # intersect starting from the shortest posting list.  Short lists
+        # are looked up in the long ones by binary search.
+        ids = postings[0]
+        for posting in postings[1:]:
+            if(len(ids) * 16 < len(posting)):
+                ids = [joke_id for joke_id in ids if _contains(posting, joke_id)]
+            else:
+                ids = sorted(set(ids).intersection(posting))
+
+    return ids
+
+
+def tokenize(text):
+    """Normalised words of a text: lower case, without accents and without
+    numbers or words shorter than TOKEN_MIN_LENGTH.
+
+    Returns
+    -------
+    tokens: set
+        Distinct tokens of the text.
+    """
+    text = text.lower()
+    if(not text.isascii()):
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+
+    return {token for token in TOKEN_PATTERN.findall(text)
+            if len(token) >= TOKEN_MIN_LENGTH and not token.isdigit()}
+
+
+def index_stats():
+    """Number of jokes, tokens and postings of the index and its memory in
+    bytes."""
+    with _lock:
+        return {
+            'jokes': len(_joke_ids),
+            'tokens': len(_postings),
+            'postings': sum(len(posting) for posting in _postings.values()),
+            'bytes': (_joke_ids.itemsize * len(_joke_ids) +
+                      sum(posting.itemsize * len(posting) for posting in _postings.values())),
+        }
+
+
+def _random_match(conn, query, attempts=64):
+    """Id of a random joke that contains every word of query, or None.
+
+    A few random ids of the shortest posting list are looked up in the
+    others before falling back to the full intersection, so common words
+    do not make the search slower.
+    """
+    tokens = tokenize(query)
+    if(len(tokens) == 0):
+        return None
+
+    with _lock:
+        postings = _sorted_postings(tokens)
+        if(len(postings[0]) == 0):
+            return None
+
+        for _ in range(attempts if len(postings) > 1 else 1):
+            joke_id = random.choice(postings[0])
+            if(all(_contains(posting, joke_id) for posting in postings[1:])):
+                return joke_id
+
+    ids = search_jokes(conn, query)
+    return random.choice(ids) if len(ids) > 0 else None
+
+
+def _sorted_postings(tokens):
+    return sorted((_postings.get(token, ()) for token in tokens), key=len)
+
+
+def _contains(posting, joke_id):
+    i = bisect.bisect_left(posting, joke_id)
+    return i < len(posting) and posting[i] == joke_id
+
+
+def _forget_joke(joke_id, tokens=()):
+    """Removes a deleted joke from the id index and from the posting lists
+    of tokens.  It stays in the other lists until they are searched."""
+    with _lock:
+        if(joke_id in _joke_ids):
+            _joke_ids.remove(joke_id)
+
+        for token in tokens:
+            posting = _postings.get(token)
+            if(posting is not None and _contains(posting, joke_id)):
+                posting.remove(joke_id)
+
+
+def get_joke(conn, joke_id):
+    """Get a single joke by its id.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    joke_id: int
+        id of the joke in jokes table.
+
+    Returns
+    -------
+    joke: str or None
+        Joke with the given id.  None if it does not exist.
+    """
+    rows = manager.query(conn, 'SELECT joke FROM jokes WHERE id = %s',
+                         (int(joke_id),))
+
+    if(len(rows) == 0):
+        return None
+
+    return rows[0][0]
+
+
+def refresh_joke_ids(conn, batch_size=10000):
+    """Adds the jokes inserted since the last refresh to the in-memory id
+    index and search index.
+
+    The first call reads the whole table in batches.  Jokes are read in
+    id order, so every posting list stays sorted.
+
     Parameters
     ----------
     conn: mysql.connector.connection_cext.CMySQLConnection
         connection with MySQL server.
 
+    batch_size: int, optional
+        number of jokes read at once.
+
     Returns
     -------
-    joke: str
-        Random joke from jokes table in database.
+    nids: int
+        number of ids added to the index.
     """
-    df = get_jokes(conn)    
-    idx = np.random.randint( len(df) )
-    
-    return df.loc[idx, 'joke']
+    global _last_id, _loaded
+
+    nids = 0
+    with _lock:
+        for rows in manager.stream(conn,
+                'SELECT id, joke FROM jokes WHERE id > %s ORDER BY id',
+                (_last_id,), batch_size=batch_size):
+            for joke_id, joke in rows:
+                _joke_ids.append(joke_id)
+                for token in tokenize(joke):
+                    _postings[token].append(joke_id)
+
+            _last_id = rows[-1][0]
+            nids += len(rows)
+
+        _loaded = True
+
+    return nids
 
 
 def get_jokes(conn):
@@ -61,4 +302,203 @@ def insert_joke(conn, joke):
     """
     nrows = manager.insert_row(conn, 'jokes', ['joke'], [joke])
 
-    return nrows
\ No newline at end of file
+    if(nrows > 0 and _loaded):
+        refresh_joke_ids(conn)
+
+    return nrows
+
+
+
+# --------------------------------------------------------------------------------
+# corpus import
+# --------------------------------------------------------------------------------
+def import_jokes(conn, path, batch_size=1000):
+    """Imports a corpus of jokes separated by blank lines.
+
+    The file is streamed, so memory does not grow with its size.  Every joke
+    has its whitespace normalised and is skipped if a joke with the same
+    content already exists.  Only the repeated jokes of a batch are found in
+    memory; the ones already in the table are ignored by its unique key and
+    counted from the rows each INSERT IGNORE writes.
+
+    The position reached is saved next to the corpus in
+    ``{path}.checkpoint`` after each batch, so running the import again only
+    reads what was appended since.  If the file did not change nothing is
+    read at all.  The checkpoint also keeps the last joke of the table when
+    it was written, and it is ignored if the table no longer has that joke,
+    e.g. when importing into another database or after a reset of jokes.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    path: str
+        path of the corpus file.
+
+    batch_size: int, optional
+        number of jokes inserted per statement.
+
+    Returns
+    -------
+    stats: dict
+        number of jokes read, inserted, duplicated and too long.
+    """
+    stats = {'read': 0, 'inserted': 0, 'duplicated': 0, 'too_long': 0}
+
+    checkpoint_path = f'{path}.checkpoint'
+    checkpoint = _read_checkpoint(checkpoint_path)
+    stat = os.stat(path)
+
+    marker = checkpoint.get('marker')
+    if(checkpoint and _table_marker(conn, marker and marker[0]) != marker):
+        logger.info('%s was imported into another jokes table.  Reading it '
+                    'from the start.', path)
+        checkpoint = {}
+
+    if(checkpoint.get('size') == stat.st_size and
+       checkpoint.get('mtime_ns') == stat.st_mtime_ns):
+        logger.info('%s did not change since the last import.', path)
+        return stats
+
+    with open(path, 'rb') as f:
+        offset = checkpoint.get('offset', 0)
+        if(not _same_prefix(f, offset, checkpoint.get('tail'))):
+            offset = 0
+
+        t0 = time.monotonic()
+        batch = {}  # joke -> None, keeps the order of the file
+        for joke, end in _read_jokes(f, offset):
+            stats['read'] += 1
+
+            if(joke in batch):
+                stats['duplicated'] += 1
+            elif(len(joke) > JOKE_MAX_LENGTH):
+                stats['too_long'] += 1
+            else:
+                batch[joke] = None
+
+            if(end is not None):
+                offset = end
+
+            if(len(batch) >= batch_size):
+                _insert_batch(conn, batch, stats)
+                _write_checkpoint(checkpoint_path, f, offset, conn)
+                batch = {}
+
+                elapsed = time.monotonic() - t0
+                logger.info('%d jokes read, %d inserted (%.0f jokes/s).',
+                            stats['read'], stats['inserted'],
+                            stats['read'] / max(elapsed, 1e-9))
+
+        _insert_batch(conn, batch, stats)
+        _write_checkpoint(checkpoint_path, f, offset, conn)
+
+    elapsed = time.monotonic() - t0
+    logger.info('Imported %s in %.2f s: %s', path, elapsed, stats)
+
+    if(_loaded):
+        refresh_joke_ids(conn)
+
+    return stats
+
+
+def _read_jokes(f, offset=0):
+    """Yields every joke of the corpus after offset.
+
+    Returns
+    -------
+    jokes: generator
+        Tuples (joke, end) where end is the offset right after the blank
+        line that closes the joke.  The last joke of the file has end None,
+        since more lines could still be appended to it.
+    """
+    f.seek(offset)
+
+    lines = []
+    for line in f:
+        offset += len(line)
+
+        if(line.strip()):
+            lines.append(line.decode('utf-8'))
+        elif(len(lines) > 0):
+            yield ' '.join(' '.join(lines).split()), offset
+            lines = []
+
+    if(len(lines) > 0):
+        yield ' '.join(' '.join(lines).split()), None
+
+
+def _insert_batch(conn, batch, stats):
+    """Inserts the jokes of a batch with INSERT IGNORE.  The ones not
+    written already existed in the table."""
+    if(len(batch) == 0):
+        return
+
+    counts = manager.insert_rows(conn, 'jokes', ['joke'],
+                                 [(joke,) for joke in batch],
+                                 repeated_entries=False,
+                                 chunk_size=len(batch))
+    stats['inserted'] += sum(counts)
+    stats['duplicated'] += len(batch) - sum(counts)
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_checkpoint(path, f, offset, conn):
+    stat = os.fstat(f.fileno())
+
+    checkpoint = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'offset': offset,
+        'tail': _tail_hash(f, offset),
+        'marker': _table_marker(conn),
+    }
+    with open(path, 'w') as fc:
+        json.dump(checkpoint, fc)
+
+
+def _table_marker(conn, joke_id=None):
+    """[id, sha1] of a joke, by default the last one of the table, or None
+    if it does not exist.  Jokes added later do not change the marker of an
+    older one."""
+    if(joke_id is None):
+        rows = manager.query(conn, 'SELECT id, joke FROM jokes ORDER BY id DESC LIMIT 1')
+    else:
+        rows = manager.query(conn, 'SELECT id, joke FROM jokes WHERE id = %s',
+                             (int(joke_id),))
+
+    if(len(rows) == 0):
+        return None
+
+    return [rows[0][0], hashlib.sha1(rows[0][1].encode('utf-8')).hexdigest()]
+
+
+def _same_prefix(f, offset, tail):
+    """Checks that the bytes before offset did not change since the last
+    import."""
+    if(offset == 0 or tail is None):
+        return False
+
+    if(os.fstat(f.fileno()).st_size < offset):
+        return False
+
+    return _tail_hash(f, offset) == tail
+
+
+def _tail_hash(f, offset, size=4096):
+    """sha1 of the bytes right before offset."""
+    position = f.tell()
+
+    f.seek(max(0, offset - size))
+    tail = hashlib.sha1(f.read(offset - max(0, offset - size))).hexdigest()
+
+    f.seek(position)
+    return tail
\ No newline at end of file
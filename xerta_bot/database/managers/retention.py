@@ -0,0 +1,326 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+# package imports
+from .. import manager
+from ..backends import get_backend
+
+
+logger = logging.getLogger(__name__)
+
+CATCH_ALL = 'p_future'  # MAXVALUE partition of the commands table
+
+# statements that delete a batch of expired commands
+DELETE_BATCH_SQL = {
+    'mysql': 'DELETE FROM commands WHERE created_at < %s LIMIT %s',
+    'sqlite': 'DELETE FROM commands WHERE id IN '
+              '(SELECT id FROM commands WHERE created_at < %s LIMIT %s)',
+}
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def run_retention(conn, days, batch_size=5000, max_days=31, pause=0.05,
+                  now=None):
+    """Removes the commands older than a number of days.
+
+    Every expired day is first rolled up into the command_daily table, once,
+    from the raw rows.  Then, if the commands table is partitioned by day,
+    the partitions of the rolled up days are dropped one at a time.  The
+    expired rows left, all of them if the table is not partitioned, are
+    deleted in batches, each one in its own transaction, so the table is
+    never locked for long.  Those are the rows written before the daily
+    partitions existed, which were kept by the first of them.
+
+    command_daily is kept apart from command_stats, which the audit writer
+    fills as commands arrive, so the two are never added together.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    days: int
+        Days of commands kept.  Today counts as one.
+
+    batch_size: int, optional
+        Rows deleted per statement when the table is not partitioned.
+
+    max_days: int, optional
+        Maximum number of days rolled up per call, which bounds the work of
+        the first run over a large table.
+
+    pause: float, optional
+        Seconds to sleep between two batches or partitions, so other writers
+        get the table.
+
+    Returns
+    -------
+    stats: dict
+        number of days rolled up, partitions dropped and rows deleted.
+    """
+    stats = {'rolled_up': 0, 'dropped': 0, 'deleted': 0}
+
+    now = datetime.datetime.now() if now is None else now
+    cutoff = _day(now) - datetime.timedelta(days=days - 1)
+
+    # roll up the expired days, oldest first
+    rolled_until = _oldest_day(conn)
+    while(rolled_until is not None and rolled_until < cutoff and
+          stats['rolled_up'] < max_days):
+        rollup_day(conn, rolled_until)
+        stats['rolled_up'] += 1
+        rolled_until += datetime.timedelta(days=1)
+
+    if(rolled_until is None):
+        return stats  # no commands at all
+    until = min(cutoff, rolled_until)
+
+    partitions = _partitions(conn)
+    if(len(partitions) > 0):
+        for name, bound in partitions:
+            if(bound is None or datetime.datetime.fromisoformat(bound) > until):
+                break
+
+            get_backend().drop_partition(conn, 'commands', name)
+            stats['dropped'] += 1
+            logger.info('Dropped partition %s of commands.', name)
+            time.sleep(pause)
+
+    sql_command = DELETE_BATCH_SQL[get_backend().DIALECT]
+    while(True):
+        cursor = manager.execute(conn, sql_command, (until, batch_size))
+        manager.commit(conn)
+
+        stats['deleted'] += cursor.rowcount
+        if(cursor.rowcount < batch_size):
+            break
+        time.sleep(pause)
+
+    manager.invalidate_cache('commands')
+    manager.invalidate_cache('command_daily')
+
+    return stats
+
+
+def rollup_day(conn, day):
+    """Adds the counts per user and command of a day to command_daily.
+
+    A day is rolled up only once: if command_daily already has it, nothing
+    is done, so a retention run interrupted before deleting the raw rows
+    does not count them twice.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    day: datetime.datetime
+        Midnight of the day.
+
+    Returns
+    -------
+    done: bool
+        False if the day had already been rolled up.
+    """
+    rows = manager.query(conn, 'SELECT 1 FROM command_daily WHERE day = %s LIMIT 1',
+                         (day.date(),))
+    if(len(rows) > 0):
+        return False
+
+    manager.execute(conn,
+        'INSERT INTO command_daily (day, user_id, command, total) '
+        'SELECT %s, user_id, command, COUNT(*) FROM commands '
+        'WHERE created_at >= %s AND created_at < %s '
+        'GROUP BY user_id, command',
+        (day.date(), day, day + datetime.timedelta(days=1)))
+    manager.commit(conn)
+
+    return True
+
+
+def ensure_partitions(conn, ahead=7, max_new=31, now=None):
+    """Creates the daily partitions of the commands table up to a number of
+    days ahead, so new rows never land in the catch-all partition.  Nothing
+    is done if the table is not partitioned.
+
+    The first partition starts today.  The rows already in the catch-all
+    partition are moved to it once and expire with batched deletes, so the
+    history is never split by day with a single long ALTER TABLE.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    ahead: int, optional
+        Days after today that must have a partition.
+
+    max_new: int, optional
+        Maximum number of partitions added by a single ALTER TABLE.  The
+        next calls add the rest.
+
+    Returns
+    -------
+    nparts: int
+        number of partitions added.
+    """
+    partitions = _partitions(conn)
+    if(len(partitions) == 0):
+        return 0
+
+    bounds = [datetime.datetime.fromisoformat(bound)
+              for _, bound in partitions if bound is not None]
+
+    # first day without partition
+    now = datetime.datetime.now() if now is None else now
+    day = max(bounds) if len(bounds) > 0 else _day(now)
+    last = _day(now) + datetime.timedelta(days=ahead)
+
+    new = []
+    while(day <= last and len(new) < max_new):
+        new.append((f'p{day:%Y%m%d}', f'{day + datetime.timedelta(days=1):%Y-%m-%d}'))
+        day += datetime.timedelta(days=1)
+
+    if(len(new) > 0):
+        get_backend().add_partitions(conn, 'commands', new, CATCH_ALL)
+        logger.info('Added %d partitions to commands.', len(new))
+
+    return len(new)
+
+
+def _partitions(conn):
+    """Partitions of commands, or an empty list if the backend or the table
+    are not partitioned."""
+    backend = get_backend()
+    if(not hasattr(backend, 'list_partitions')):
+        return []
+
+    return backend.list_partitions(conn, 'commands')
+
+
+def _oldest_day(conn):
+    rows = manager.query(conn, 'SELECT MIN(created_at) FROM commands')
+    oldest = rows[0][0]
+
+    if(oldest is None):
+        return None
+    if(isinstance(oldest, str)):
+        oldest = datetime.datetime.fromisoformat(oldest)
+
+    return _day(oldest)
+
+
+def _day(t):
+    return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# --------------------------------------------------------------------------------
+# background job
+# --------------------------------------------------------------------------------
+_job = None
+
+
+def start_retention():
+    """Starts the background retention job.  It is configured with the
+    following environment variables:
+
+    RETENTION_DAYS: days of raw commands kept.  By default 90.  0 disables
+        the job.
+    RETENTION_INTERVAL: seconds between two runs.  By default 3600.
+    RETENTION_BATCH_SIZE: rows deleted per statement on tables that are not
+        partitioned.  By default 5000.
+    RETENTION_PARTITIONS_AHEAD: days ahead with a partition.  By default 7.
+
+    Returns
+    -------
+    job: RetentionJob or None
+        running job, None if it is disabled.
+    """
+    global _job
+
+    days = int(os.environ.get('RETENTION_DAYS', 90))
+    if(_job is None and days > 0):
+        _job = RetentionJob(days,
+            interval=float(os.environ.get('RETENTION_INTERVAL', 3600)),
+            batch_size=int(os.environ.get('RETENTION_BATCH_SIZE', 5000)),
+            ahead=int(os.environ.get('RETENTION_PARTITIONS_AHEAD', 7))
+        )
+        _job.start()
+
+    return _job
+
+
+def stop_retention(timeout=None):
+    """Stops the background retention job after the current run."""
+    global _job
+
+    if(_job is not None):
+        _job.stop(timeout)
+        _job = None
+
+
+class RetentionJob:
+    """Runs ensure_partitions and run_retention periodically from a
+    background thread.
+
+    Parameters
+    ----------
+    days: int
+        Days of commands kept.
+
+    interval: float
+        Seconds between two runs.  The first run starts right away.
+
+    batch_size: int
+        Rows deleted per statement on tables that are not partitioned.
+
+    ahead: int
+        Days ahead with a partition.
+    """
+
+    def __init__(self, days, interval=3600, batch_size=5000, ahead=7):
+        self.days = days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.ahead = ahead
+
+        self.stats = {'runs': 0, 'failed': 0, 'rolled_up': 0, 'dropped': 0,
+                      'deleted': 0}
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='retention',
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def run_once(self):
+        with manager.connection() as conn:
+            ensure_partitions(conn, self.ahead)
+            stats = run_retention(conn, self.days, self.batch_size)
+
+        self.stats['runs'] += 1
+        for key, value in stats.items():
+            self.stats[key] += value
+
+        if(any(stats.values())):
+            logger.info('Retention of commands: %s', stats)
+
+    def _run(self):
+        while(not self._stop.is_set()):
+            try:
+                self.run_once()
+            except Exception:
+                self.stats['failed'] += 1
+                logger.exception('Error while applying the retention of commands.')
+
+            self._stop.wait(self.interval)
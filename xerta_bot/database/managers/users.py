@@ -1,11 +1,41 @@
-import pandas as pd
-import pathlib
-import sqlite3
+import collections
+import os
+import threading
+import time
 
 # package imports    
 from .. import manager
 
 
+# --------------------------------------------------------------------------------
+# privilege cache
+# --------------------------------------------------------------------------------
+PRIVILEGE_CACHE_TTL = float(os.environ.get('PRIVILEGE_CACHE_TTL', 60))
+
+_privileges = {}  # privilege level -> set of user ids
+_privileges_loaded_at = None
+_privileges_stats = {'hits': 0, 'misses': 0}
+_privileges_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------
+# recently seen users
+# --------------------------------------------------------------------------------
+USER_SEEN_TTL = float(os.environ.get('USER_SEEN_TTL', 3600))
+USER_SEEN_SIZE = int(os.environ.get('USER_SEEN_SIZE', 10000))
+
+_seen = collections.OrderedDict()  # user id -> (values, time of the write)
+_seen_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------
+# user counts
+# --------------------------------------------------------------------------------
+USER_COUNT_TTL = float(os.environ.get('USER_COUNT_TTL', 60))
+
+_counts = {}  # privilege -> (number of users, time of the count)
+
+
 # --------------------------------------------------------------------------------
 # functions
 # --------------------------------------------------------------------------------
@@ -31,6 +61,72 @@ def get_users(conn, privilege=None):
         df = manager.get_table(conn, 'users', where={'privilege':privilege})
 
     return df
+
+
+def list_users(conn, privilege=None, limit=50, offset=0):
+    """Returns the names of a page of users sorted by name.  The pages are
+    kept in the query result cache until users changes.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    privilege: int or None
+        Returns users with specified privilege level.
+
+    limit: int
+        Maximum number of users.
+
+    offset: int
+        Number of users skipped before the first one returned.
+
+    Returns
+    -------
+    users: list
+        Tuples (first_name, last_name).  last_name may be None.
+    """
+    where = None if privilege is None else {'privilege': privilege}
+
+    rows = manager.select(conn, 'users', ['first_name', 'last_name'],
+        where=where,
+        order_by=['first_name', 'last_name', 'id'],
+        limit=limit,
+        offset=offset,
+        cache=True
+    )
+
+    return rows
+
+
+def count_users(conn, privilege=None):
+    """Returns the number of users.  The count is cached for USER_COUNT_TTL
+    seconds.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    privilege: int or None
+        Counts users with specified privilege level.
+
+    Returns
+    -------
+    nusers: int
+        number of users.
+    """
+    now = time.monotonic()
+
+    count = _counts.get(privilege)
+    if(count is not None and now - count[1] < USER_COUNT_TTL):
+        return count[0]
+
+    where = None if privilege is None else {'privilege': privilege}
+    nusers = manager.count_rows(conn, 'users', where=where)
+    _counts[privilege] = (nusers, now)
+
+    return nusers
     
 
 def update_user(conn, columns, values):
@@ -57,7 +153,11 @@ def update_user(conn, columns, values):
 
 
 def insert_user(conn, columns, values):
-    """Inserts a user to users table in database.
+    """Inserts a user to users table in database, or updates it if it
+    already exists.
+
+    The write is skipped if the same values were written for the user less
+    than USER_SEEN_TTL seconds ago.
 
     Parameters
     ----------
@@ -65,7 +165,8 @@ def insert_user(conn, columns, values):
         connection with MySQL server.
 
     columns: list
-        Columns that are going to be used to insert data
+        Columns that are going to be used to insert data.  It must include
+        'id'.
 
     values: list
         Values that are going to be inserted in the database
@@ -73,17 +174,142 @@ def insert_user(conn, columns, values):
     Returns
     -------
     nrows: int
-        number of rows inserted to the table.
+        1 if the user was inserted or changed, 0 otherwise.
     """
-    nrows = manager.insert_row(conn, 'users', columns, values)
+    values = tuple(values)
+    user_id = values[list(columns).index('id')]
 
-    if(nrows == 0):  # update user
-        where = {col:val for col, val in zip(columns, values) if col == 'id'}
-        
-        for column, value in zip(columns, values):
-            if(column == 'id'):
-                continue
-            else:
-                manager.update_column(conn, 'users', column, value, **where)
-    
-    return nrows
\ No newline at end of file
+    now = time.monotonic()
+    with _seen_lock:
+        seen = _seen.get(user_id)
+        if(seen is not None and seen[0] == values and now - seen[1] < USER_SEEN_TTL):
+            _seen.move_to_end(user_id)
+            return 0
+
+    nrows = manager.upsert_row(conn, 'users', columns, values, keys=['id'])
+
+    # only MySQL tells an insert from an update, so every write drops the
+    # counts.  Writes are rare thanks to the seen users.
+    if(nrows > 0):
+        _counts.clear()
+
+    with _seen_lock:
+        _seen[user_id] = (values, now)
+        _seen.move_to_end(user_id)
+        while(len(_seen) > USER_SEEN_SIZE):
+            _seen.popitem(last=False)
+
+    return 1 if nrows > 0 else 0
+
+
+def set_privilege(conn, user_id, privilege):
+    """Changes the privilege level of a user.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    user_id: int
+        Telegram id of the user
+
+    privilege: int
+        New privilege level of the user.
+
+    Returns
+    -------
+    nrows: int
+        number of rows updated in the table.
+    """
+    nrows = manager.update_column(conn, 'users', 'privilege', privilege,
+                                  id=int(user_id))
+    invalidate_privileges()
+    _counts.clear()
+
+    return nrows
+
+
+def has_privilege(conn, user_id, *privileges):
+    """Checks if a user has any of the given privilege levels.
+
+    Users with a privilege greater than 0 are cached in memory, one set per
+    privilege level, and reloaded every PRIVILEGE_CACHE_TTL seconds.  Most
+    checks are a set lookup without any query.
+
+    Parameters
+    ----------
+    conn: mysql.connector.connection_cext.CMySQLConnection
+        connection with MySQL server.
+
+    user_id: int
+        Telegram id of the user
+
+    *privileges: int
+        Privilege levels that grant access.
+
+    Returns
+    -------
+    allowed: bool
+        True if the user has one of the privilege levels.
+    """
+    global _privileges, _privileges_loaded_at
+
+    user_id = int(user_id)
+
+    with _privileges_lock:
+        now = time.monotonic()
+        expired = _privileges_loaded_at is None or \
+            now - _privileges_loaded_at > PRIVILEGE_CACHE_TTL
+
+        if(expired):
+            _privileges_stats['misses'] += 1
+            _privileges = _load_privileges(conn)
+            _privileges_loaded_at = now
+        else:
+            _privileges_stats['hits'] += 1
+
+        for privilege in privileges:
+            if(user_id in _privileges.get(privilege, ())):
+                return True
+
+    return False
+
+
+def invalidate_privileges():
+    """Forces the privilege cache to be reloaded on the next check."""
+    global _privileges_loaded_at
+
+    with _privileges_lock:
+        _privileges_loaded_at = None
+
+
+def privilege_cache_stats():
+    """Returns the counters of the privilege cache.
+
+    Returns
+    -------
+    stats: dict
+        hits, misses and number of cached users.
+    """
+    with _privileges_lock:
+        stats = dict(_privileges_stats)
+        stats['users'] = sum(len(ids) for ids in _privileges.values())
+
+    return stats
+
+
+def _load_privileges(conn):
+    """Reads every user with a privilege greater than 0.
+
+    Returns
+    -------
+    privileges: dict
+        Set of user ids for each privilege level.
+    """
+    rows = manager.query(conn, 'SELECT id, privilege FROM users WHERE privilege > 0')
+
+    privileges = {}
+    for user_id, privilege in rows:
+        privileges.setdefault(privilege, set()).add(user_id)
+
+    return privileges
\ No newline at end of file
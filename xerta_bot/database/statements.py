@@ -0,0 +1,100 @@
+import functools
+
+# local modules
+from .formater import fmt_columns, fmt_identifier
+
+
+# ------------------------------------------------------------------------
+# statements
+# ------------------------------------------------------------------------
+# Every function returns the text of a statement with a %s placeholder for
+# each value.  The text only depends on the shape of the query (table,
+# columns and WHERE keys), so it is built once and cached.  Passing the
+# same string object to a prepared cursor lets it skip the PREPARE step.
+# Arguments must be hashable: use tuples instead of lists.
+
+@functools.lru_cache(maxsize=1024)
+def insert_sql(table, columns, ignore=False, dialect='mysql'):
+    """INSERT [IGNORE] INTO table (columns) VALUES (%s, ...)"""
+    if(not ignore):
+        insert = 'INSERT'
+    elif(dialect == 'sqlite'):
+        insert = 'INSERT OR IGNORE'
+    else:
+        insert = 'INSERT IGNORE'
+
+    return f'{insert} INTO {fmt_identifier(table)} ({fmt_columns(columns)}) ' + \
+        f'VALUES ({_placeholders(len(columns))})'
+
+
+@functools.lru_cache(maxsize=1024)
+def upsert_sql(table, columns, keys, increment=(), dialect='mysql'):
+    """INSERT INTO table ... ON DUPLICATE KEY UPDATE col=VALUES(col), ...
+
+    The columns in increment are added to their current value.  SQLite uses
+    ON CONFLICT (keys) DO UPDATE SET col=excluded.col instead.
+    """
+    if(dialect == 'sqlite'):
+        new, conflict = 'excluded.{}', f' ON CONFLICT ({fmt_columns(keys)}) DO UPDATE SET '
+    else:
+        new, conflict = 'VALUES({})', ' ON DUPLICATE KEY UPDATE '
+
+    updates = [
+        f'{col}={col}+{new.format(col)}' if col in increment else f'{col}={new.format(col)}'
+        for col in columns if col not in keys
+    ]
+    if(len(updates) == 0):
+        if(dialect == 'sqlite'):
+            return insert_sql(table, columns) + \
+                f' ON CONFLICT ({fmt_columns(keys)}) DO NOTHING'
+        updates = [f'{keys[0]}={keys[0]}']
+
+    return insert_sql(table, columns) + conflict + ', '.join(updates)
+
+
+@functools.lru_cache(maxsize=1024)
+def update_sql(table, column, where_keys=()):
+    """UPDATE table SET column=%s [WHERE key=%s AND ...]"""
+    return f'UPDATE {fmt_identifier(table)} SET {fmt_identifier(column)}=%s' + \
+        _where(where_keys)
+
+
+@functools.lru_cache(maxsize=1024)
+def delete_sql(table, where_keys=()):
+    """DELETE FROM table [WHERE key=%s AND ...]"""
+    return f'DELETE FROM {fmt_identifier(table)}' + _where(where_keys)
+
+
+@functools.lru_cache(maxsize=1024)
+def select_sql(table, columns, where_keys=(), order_by=(), limit=False,
+               offset=False):
+    """SELECT columns FROM table [WHERE ...] [ORDER BY ...] [LIMIT %s [OFFSET %s]]"""
+    sql_command = f'SELECT {fmt_columns(columns)} FROM {fmt_identifier(table)}' + \
+        _where(where_keys)
+
+    if(len(order_by) > 0):
+        sql_command += f' ORDER BY {fmt_columns(order_by)}'
+
+    if(limit):
+        sql_command += ' LIMIT %s'
+        if(offset):
+            sql_command += ' OFFSET %s'
+
+    return sql_command
+
+
+@functools.lru_cache(maxsize=1024)
+def count_sql(table, where_keys=()):
+    """SELECT COUNT(*) FROM table [WHERE ...]"""
+    return f'SELECT COUNT(*) FROM {fmt_identifier(table)}' + _where(where_keys)
+
+
+def _where(keys):
+    if(len(keys) == 0):
+        return ''
+
+    return ' WHERE ' + ' AND '.join(f'{fmt_identifier(key)}=%s' for key in keys)
+
+
+def _placeholders(n):
+    return ', '.join(['%s']*n)
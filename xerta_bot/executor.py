@@ -0,0 +1,134 @@
+import logging
+import queue
+import threading
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------------------------------------
+# executor
+# --------------------------------------------------------------------------------
+class ChatExecutor:
+    """Runs handlers in a pool of worker threads without losing the order of
+    the updates of each chat.
+
+    Every chat is always assigned to the same worker, so its updates are
+    handled one after the other, while updates from different chats run in
+    parallel.
+
+    Parameters
+    ----------
+    workers: int
+        Number of worker threads.  The database connection pool should have
+        at least this many connections.
+
+    maxsize: int
+        Maximum number of pending updates per worker.  submit blocks when
+        the queue of a worker is full.
+    """
+
+    def __init__(self, workers=4, maxsize=1000):
+        self._queues = [queue.Queue(maxsize) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f'chat-worker-{i}',
+                             daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, func, *args, timeout=None):
+        """Schedules func(*args) in the worker assigned to key.
+
+        Parameters
+        ----------
+        key: int or str
+            Chat id.  Calls with the same key run in submission order.
+
+        func: callable
+            Function to be executed.
+
+        timeout: float or None
+            Seconds to wait if the worker queue is full.
+
+        Raises
+        ------
+        queue.Full
+            If the queue is still full after timeout seconds.
+        """
+        self._queues[self.worker(key)].put((func, args), timeout=timeout)
+
+    def worker(self, key):
+        """Index of the worker that handles key."""
+        return zlib.crc32(str(key).encode()) % len(self._queues)
+
+    def wrap(self, callback):
+        """Wraps a telegram handler callback so it runs in the pool."""
+        def wrapper(update, context):
+            chat = update.effective_chat
+            key = chat.id if chat is not None else None
+
+            self.submit(key, callback, update, context)
+
+        wrapper.__name__ = callback.__name__
+        wrapper.__doc__ = callback.__doc__
+
+        return wrapper
+
+    def pending(self):
+        """Number of updates waiting to be handled."""
+        return sum(q.qsize() for q in self._queues)
+
+    def shutdown(self, wait=True):
+        """Handles every pending update and stops the workers."""
+        for q in self._queues:
+            q.put(None)
+
+        if(wait):
+            for thread in self._threads:
+                thread.join()
+
+    def _run(self, q):
+        while(True):
+            job = q.get()
+            if(job is None):
+                break
+
+            func, args = job
+            try:
+                func(*args)
+            except Exception:
+                logger.exception('Error while running %s.', func.__name__)
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def chat_id(data):
+    """Chat id of an update as decoded from the Telegram JSON, used as the
+    key that keeps the order of each chat.  Updates without a chat use
+    their update_id.
+
+    Raises
+    ------
+    ValueError
+        If data does not have the shape of an update.
+    """
+    if(not isinstance(data, dict)):
+        raise ValueError('An update must be a JSON object.')
+
+    try:
+        for key in ('message', 'edited_message', 'channel_post',
+                    'edited_channel_post'):
+            if(key in data):
+                return data[key]['chat']['id']
+
+        if('callback_query' in data):
+            return data['callback_query']['from']['id']
+
+        return data['update_id']
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'Malformed update: {e!r}') from e
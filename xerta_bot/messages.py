@@ -0,0 +1,122 @@
+import os
+import pathlib
+import string
+import threading
+import time
+
+
+# --------------------------------------------------------------------------------
+# message templates
+# --------------------------------------------------------------------------------
+MESSAGES_PATH = pathlib.Path(__file__).parent.absolute() / 'database' / 'messages'
+
+# reload the templates when the files change.  Useful while editing them.
+MESSAGES_RELOAD = os.environ.get('MESSAGES_RELOAD', '0') == '1'
+MESSAGES_RELOAD_INTERVAL = 1.0  # seconds between checks of the files
+
+_templates = {}  # (name, language_code) -> string.Template
+_mtimes = {}  # path -> modification time
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+# --------------------------------------------------------------------------------
+# functions
+# --------------------------------------------------------------------------------
+def load(path=MESSAGES_PATH):
+    """Reads every message template in a directory.
+
+    A file named ``{name}.txt`` is the default template of a message and
+    ``{name}.{language_code}.txt`` its variant for a language, e.g.
+    ``start.es.txt``.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Directory with the templates.
+    """
+    global _templates, _mtimes
+
+    templates = {}
+    mtimes = {}
+    for file in pathlib.Path(path).glob('*.txt'):
+        parts = file.name[:-len('.txt')].split('.', 1)
+        name = parts[0]
+        language_code = parts[1].lower() if len(parts) > 1 else None
+
+        with open(file, mode='r') as f:
+            templates[(name, language_code)] = string.Template(f.read())
+        mtimes[file] = file.stat().st_mtime_ns
+
+    with _lock:
+        _templates = templates
+        _mtimes = mtimes
+
+
+def render(name, language_code=None, **fields):
+    """Returns a message in the language of the user.
+
+    Parameters
+    ----------
+    name: str
+        Name of the message, i.e. its file name without extension.
+
+    language_code: str or None
+        IETF language tag of the user, e.g. 'es' or 'pt-br'.  If there is
+        no template for it, the base language and then the default template
+        are used.
+
+    **fields:
+        Values of the $placeholders in the template.  Placeholders without
+        a value are left as they are.
+
+    Returns
+    -------
+    msg: str
+        Rendered message.
+    """
+    if(MESSAGES_RELOAD):
+        _reload_if_changed()
+
+    template = None
+    for code in _candidates(language_code):
+        template = _templates.get((name, code))
+        if(template is not None):
+            break
+
+    if(template is None):
+        raise KeyError(f'There is no message named {name!r}.')
+
+    return template.safe_substitute(fields)
+
+
+def _candidates(language_code):
+    """Language codes to try, from the most to the least specific."""
+    if(language_code):
+        language_code = language_code.lower()
+        yield language_code
+
+        if('-' in language_code):
+            yield language_code.split('-')[0]
+
+    yield None
+
+
+def _reload_if_changed():
+    global _checked_at
+
+    now = time.monotonic()
+    if(now - _checked_at < MESSAGES_RELOAD_INTERVAL):
+        return
+    _checked_at = now
+
+    files = list(MESSAGES_PATH.glob('*.txt'))
+    changed = len(files) != len(_mtimes) or any(
+        _mtimes.get(file) != file.stat().st_mtime_ns for file in files)
+
+    if(changed):
+        load()
+
+
+# load the templates once at startup
+load()
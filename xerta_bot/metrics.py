@@ -0,0 +1,365 @@
+"""Low overhead instrumentation of the handlers and the database calls.
+
+Handlers decorated with ``observed`` open a scope per update: the time of
+the whole update and the database round trips, rows fetched and commits
+made by its thread are recorded as histograms labelled by handler.  The
+decorators of xerta_bot.wrappers are timed with ``timed``.
+
+Everything is exposed in the Prometheus text format by ``MetricsServer``.
+http.server is only imported when the endpoint is created, so importing
+this module stays cheap.
+Set XERTA_METRICS=0 to disable it: the decorators then return the
+functions unchanged and the database hooks return immediately.
+"""
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('XERTA_METRICS', '1') != '0'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 1000, 10000)
+
+
+# --------------------------------------------------------------------------------
+# metric types
+# --------------------------------------------------------------------------------
+class Counter:
+    """Monotonic counter with labels.
+
+    Parameters
+    ----------
+    name: str
+        Name of the metric.
+
+    documentation: str
+        Help text of the metric.
+
+    labels: tuple, optional
+        Names of the labels.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+        self._values = {}  # label values -> total
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+
+        for label_values, total in values:
+            yield self.name + '_total', self._labels(label_values), total
+
+    def _labels(self, label_values, **extra):
+        pairs = list(zip(self.labels, label_values)) + list(extra.items())
+        return ','.join(f'{key}="{value}"' for key, value in pairs)
+
+
+class Histogram(Counter):
+    """Histogram with cumulative buckets and labels.
+
+    Parameters
+    ----------
+    name: str
+        Name of the metric.
+
+    documentation: str
+        Help text of the metric.
+
+    labels: tuple, optional
+        Names of the labels.
+
+    buckets: tuple, optional
+        Sorted upper bounds of the buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            state = self._values.get(label_values)
+            if(state is None):
+                # counts of each bucket and +Inf, sum
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0]
+
+            state[0][i] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(label_values, list(counts), total)
+                      for label_values, (counts, total) in self._values.items()]
+
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       self._labels(label_values, le=bound), cumulative)
+
+            yield self.name + '_sum', self._labels(label_values), total
+            yield self.name + '_count', self._labels(label_values), cumulative
+
+
+# --------------------------------------------------------------------------------
+# registry
+# --------------------------------------------------------------------------------
+registry = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+def render():
+    """Every metric of the registry in the Prometheus text format."""
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+update_seconds = register(Histogram('xerta_update_seconds',
+    'Time to process an update, by handler.', ['handler']))
+stage_seconds = register(Histogram('xerta_stage_seconds',
+    'Time spent inside each decorator stage, including the inner ones.',
+    ['stage', 'handler']))
+update_db_round_trips = register(Histogram('xerta_update_db_round_trips',
+    'Database round trips made by an update.', ['handler'], COUNT_BUCKETS))
+update_db_rows = register(Histogram('xerta_update_db_rows',
+    'Rows fetched from the database by an update.', ['handler'], COUNT_BUCKETS))
+update_db_commits = register(Histogram('xerta_update_db_commits',
+    'Commits made by an update.', ['handler'], COUNT_BUCKETS))
+update_errors = register(Counter('xerta_update_errors',
+    'Updates whose handler raised an exception.', ['handler']))
+db_connections = register(Counter('xerta_db_connections',
+    'Connections checked out from the pool.'))
+db_round_trips = register(Counter('xerta_db_round_trips',
+    'Database round trips, including the ones outside updates.'))
+db_rows = register(Counter('xerta_db_rows',
+    'Rows fetched from the database, including the ones outside updates.'))
+db_commits = register(Counter('xerta_db_commits',
+    'Commits, including the ones outside updates.'))
+
+
+# --------------------------------------------------------------------------------
+# decorators
+# --------------------------------------------------------------------------------
+_local = threading.local()
+
+
+def observed(func):
+    """Records the time and the database calls of every update handled by
+    func.  It must be the outermost decorator of a handler."""
+    if(not ENABLED):
+        return func
+
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(update, context):
+        scope = _local.scope = [0, 0, 0]  # round trips, rows, commits
+
+        t0 = time.perf_counter()
+        try:
+            func(update, context)
+        except Exception:
+            update_errors.inc(1, name)
+            raise
+        finally:
+            update_seconds.observe(time.perf_counter() - t0, name)
+            _local.scope = None
+
+            update_db_round_trips.observe(scope[0], name)
+            update_db_rows.observe(scope[1], name)
+            update_db_commits.observe(scope[2], name)
+
+            db_round_trips.inc(scope[0])
+            db_rows.inc(scope[1])
+            db_commits.inc(scope[2])
+
+    return wrapper
+
+
+def timed(stage):
+    """Records the time spent in a decorator stage, labelled by stage and
+    handler name."""
+    def decorator(func):
+        if(not ENABLED):
+            return func
+
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(update, context):
+            t0 = time.perf_counter()
+            try:
+                func(update, context)
+            finally:
+                stage_seconds.observe(time.perf_counter() - t0, stage, name)
+
+        return wrapper
+
+    return decorator
+
+
+# --------------------------------------------------------------------------------
+# database hooks
+# --------------------------------------------------------------------------------
+def db_round_trip(rows=0):
+    """Called by the database manager for every statement sent."""
+    if(not ENABLED):
+        return
+
+    scope = getattr(_local, 'scope', None)
+    if(scope is not None):
+        scope[0] += 1
+        scope[1] += rows
+    else:
+        db_round_trips.inc()
+        if(rows):
+            db_rows.inc(rows)
+
+
+def db_rows_fetched(rows):
+    """Called by the database manager for rows fetched after the statement
+    was sent, e.g. by a streaming cursor."""
+    if(not ENABLED):
+        return
+
+    scope = getattr(_local, 'scope', None)
+    if(scope is not None):
+        scope[1] += rows
+    else:
+        db_rows.inc(rows)
+
+
+def db_commit():
+    if(not ENABLED):
+        return
+
+    scope = getattr(_local, 'scope', None)
+    if(scope is not None):
+        scope[2] += 1
+    else:
+        db_commits.inc()
+
+
+def db_connect():
+    if(ENABLED):
+        db_connections.inc()
+
+
+# --------------------------------------------------------------------------------
+# endpoint
+# --------------------------------------------------------------------------------
+class MetricsServer:
+    """HTTP endpoint that serves the registry at /metrics.
+
+    Parameters
+    ----------
+    host: str, optional
+        Address to listen on.  Keep it local, the metrics are not protected.
+
+    port: int, optional
+        Port to listen on, 0 picks a free one.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9108):
+        import http.server
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), _handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name='metrics', daemon=True)
+        self.thread.start()
+        logger.info('Metrics listening on %s:%s', *self.address[:2])
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if(self.thread is not None):
+            self.thread.join()
+
+
+@functools.lru_cache(maxsize=None)
+def _handler_class():
+    """Request handler of the endpoint, defined on first use."""
+    import http.server
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if(self.path.split('?')[0] != '/metrics'):
+                self.send_error(404)
+                return
+
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return _Handler
+
+
+_server = None
+
+
+def start_metrics_server():
+    """Starts the endpoint configured with METRICS_HOST and METRICS_PORT,
+    unless metrics are disabled with XERTA_METRICS=0."""
+    global _server
+
+    if(not ENABLED or _server is not None):
+        return _server
+
+    _server = MetricsServer(os.environ.get('METRICS_HOST', '127.0.0.1'),
+                            int(os.environ.get('METRICS_PORT', 9108)))
+    _server.start()
+    return _server
+
+
+def stop_metrics_server():
+    global _server
+
+    if(_server is not None):
+        _server.shutdown()
+        _server = None
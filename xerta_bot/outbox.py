@@ -0,0 +1,300 @@
+import collections
+import heapq
+import logging
+import os
+import threading
+import time
+
+# package imports
+from .ratelimit import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram limit
+
+
+# --------------------------------------------------------------------------------
+# outbox
+# --------------------------------------------------------------------------------
+class Outbox:
+    """Queue of outgoing messages that respects the Telegram rate limits.
+
+    Messages are sent by background threads.  Every chat receives at most
+    chat_rate messages per second and all chats together global_rate.
+    Consecutive plain messages waiting for the same chat are joined in a
+    single message.  When Telegram answers 429 the chat is paused for the
+    retry_after seconds it asks for.
+
+    Parameters
+    ----------
+    bot: telegram.Bot
+        Any object with a send_message(chat_id, text, **kwargs) method.
+
+    chat_rate: float
+        Messages per second sent to a chat.
+
+    global_rate: float
+        Messages per second sent to every chat together.
+
+    senders: int
+        Number of threads sending messages.  The messages of a chat are
+        always sent in order.
+
+    max_retries: int
+        Times a message is sent again after an error other than 429.
+
+    coalesce: bool
+        Join consecutive plain messages to the same chat.
+    """
+
+    def __init__(self, bot, chat_rate=1.0, global_rate=30.0, senders=4,
+                 max_retries=3, coalesce=True):
+        self.bot = bot
+        self.chat_interval = 1.0 / chat_rate
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+
+        self.stats = {'queued': 0, 'sent': 0, 'coalesced': 0, 'retried': 0,
+                      'failed': 0}
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._pending = {}  # chat id -> deque of [text, kwargs, attempts]
+        self._next = {}  # chat id -> earliest time of its next message
+        self._ready = []  # heap of (time, chat id) of scheduled chats
+        self._busy = 0  # chats being sent right now
+        self._stop = False
+        self._cond = threading.Condition()
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+            for i in range(senders)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Sends every pending message and stops the threads."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def send(self, chat_id, text, **kwargs):
+        """Queues a message.  It returns immediately.
+
+        Parameters
+        ----------
+        chat_id: int
+            Chat that receives the message.
+
+        text: str
+            Text of the message.
+
+        **kwargs:
+            Other arguments of send_message, e.g. reply_markup.
+        """
+        kwargs = {key: val for key, val in kwargs.items() if val is not None}
+
+        with self._cond:
+            pending = self._pending.get(chat_id)
+            if(pending is None):
+                pending = self._pending[chat_id] = collections.deque()
+                self._schedule(chat_id, self._next.get(chat_id, 0.0))
+
+            pending.append([text, kwargs, 0])
+            self.stats['queued'] += 1
+
+    def pending(self):
+        """Number of messages waiting to be sent."""
+        with self._cond:
+            return sum(len(pending) for pending in self._pending.values())
+
+    def _schedule(self, chat_id, when):
+        heapq.heappush(self._ready, (when, chat_id))
+        self._cond.notify()
+
+    def _run(self):
+        while(True):
+            job = self._take()
+            if(job is None):
+                return
+
+            chat_id, text, kwargs, attempts = job
+            delay = self._deliver(chat_id, text, kwargs, attempts)
+
+            with self._cond:
+                self._busy -= 1
+                self._next[chat_id] = time.monotonic() + max(delay, self.chat_interval)
+
+                if(len(self._pending[chat_id]) > 0):
+                    self._schedule(chat_id, self._next[chat_id])
+                else:
+                    del self._pending[chat_id]
+
+                if(len(self._next) > 10 * len(self._pending) + 1000):
+                    self._forget_idle_chats()
+
+                self._cond.notify_all()
+
+    def _take(self):
+        """Waits for the next chat whose turn has come and takes its
+        messages."""
+        with self._cond:
+            while(True):
+                now = time.monotonic()
+
+                if(len(self._ready) == 0):
+                    if(self._stop and self._busy == 0):
+                        return None
+                    self._cond.wait()
+                    continue
+
+                when, chat_id = self._ready[0]
+                if(when > now):
+                    self._cond.wait(when - now)
+                    continue
+
+                wait = self._global.wait_time(now=now)
+                if(wait > 0):
+                    self._cond.wait(wait)
+                    continue
+
+                heapq.heappop(self._ready)
+                self._global.consume(now=now)
+                self._busy += 1
+
+                text, kwargs, attempts = self._pop_message(chat_id)
+                return chat_id, text, kwargs, attempts
+
+    def _pop_message(self, chat_id):
+        pending = self._pending[chat_id]
+        text, kwargs, attempts = pending.popleft()
+
+        # join the plain messages that follow
+        while(self.coalesce and len(kwargs) == 0 and len(pending) > 0):
+            next_text, next_kwargs, _ = pending[0]
+            if(len(next_kwargs) > 0 or
+               len(text) + 2 + len(next_text) > MAX_MESSAGE_LENGTH):
+                break
+
+            pending.popleft()
+            text = f'{text}\n\n{next_text}'
+            self.stats['coalesced'] += 1
+
+        return text, kwargs, attempts
+
+    def _deliver(self, chat_id, text, kwargs, attempts):
+        """Sends a message.
+
+        Returns
+        -------
+        delay: float
+            Seconds to wait before sending the next message to the chat.
+        """
+        try:
+            self.bot.send_message(chat_id, text, **kwargs)
+        except Exception as e:
+            retry_after = getattr(e, 'retry_after', None)
+
+            if(retry_after is None and attempts >= self.max_retries):
+                self._count('failed')
+                logger.exception('Could not send a message to chat %s.', chat_id)
+                return 0.0
+
+            with self._cond:
+                self._pending[chat_id].appendleft([text, kwargs, attempts + 1])
+            self._count('retried')
+
+            if(retry_after is not None):
+                logger.warning('Too many requests to chat %s.  Retrying in %s s.',
+                               chat_id, retry_after)
+                return float(retry_after)
+
+            return self.chat_interval * 2 ** attempts
+
+        self._count('sent')
+        return 0.0
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [c for c, t in self._next.items()
+                        if t < now and c not in self._pending]:
+            del self._next[chat_id]
+
+    def _count(self, key):
+        with self._cond:
+            self.stats[key] += 1
+
+
+# --------------------------------------------------------------------------------
+# default outbox
+# --------------------------------------------------------------------------------
+_outbox = None
+
+
+def start_outbox(bot):
+    """Starts the outbox used by reply.  It is configured with the following
+    environment variables:
+
+    OUTBOX_CHAT_RATE: messages per second to each chat.  By default 1.
+    OUTBOX_GLOBAL_RATE: messages per second to every chat.  By default 30.
+    OUTBOX_SENDERS: threads sending messages.  By default 4.
+
+    Parameters
+    ----------
+    bot: telegram.Bot
+        Bot used to send the messages.
+
+    Returns
+    -------
+    outbox: Outbox
+        running outbox.
+    """
+    global _outbox
+
+    if(_outbox is None):
+        _outbox = Outbox(bot,
+            chat_rate=float(os.environ.get('OUTBOX_CHAT_RATE', 1)),
+            global_rate=float(os.environ.get('OUTBOX_GLOBAL_RATE', 30)),
+            senders=int(os.environ.get('OUTBOX_SENDERS', 4))
+        )
+        _outbox.start()
+
+    return _outbox
+
+
+def stop_outbox(timeout=None):
+    """Sends every pending message and stops the outbox."""
+    global _outbox
+
+    if(_outbox is not None):
+        _outbox.stop(timeout)
+        _outbox = None
+
+
+def reply(update, text, **kwargs):
+    """Answers an update in its chat.
+
+    If the outbox is running the message is queued and sent in the
+    background.  Otherwise it is sent right away.
+
+    Parameters
+    ----------
+    update: telegram.Update
+        Update being answered.
+
+    text: str
+        Text of the message.
+
+    **kwargs:
+        Other arguments of send_message, e.g. reply_markup.
+    """
+    if(_outbox is not None):
+        _outbox.send(update.effective_chat.id, text, **kwargs)
+    else:
+        update.effective_message.reply_text(text, **kwargs)
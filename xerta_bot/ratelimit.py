@@ -0,0 +1,146 @@
+import collections
+import threading
+import time
+
+
+# --------------------------------------------------------------------------------
+# token buckets
+# --------------------------------------------------------------------------------
+class TokenBucket:
+    """Bucket that refills rate tokens per second up to capacity.
+
+    Parameters
+    ----------
+    rate: float
+        Tokens added per second.
+
+    capacity: float
+        Maximum number of tokens, i.e. the size of a burst.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def consume(self, n=1, now=None):
+        """Takes n tokens if there are enough.
+
+        Returns
+        -------
+        allowed: bool
+            False if the bucket does not have n tokens.
+        """
+        if(now is None):
+            now = time.monotonic()
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if(self.tokens < n):
+            return False
+
+        self.tokens -= n
+        return True
+
+    def wait_time(self, n=1, now=None):
+        """Seconds until the bucket has n tokens."""
+        if(now is None):
+            now = time.monotonic()
+
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        return max(0.0, (n - tokens) / self.rate)
+
+
+class RateLimiter:
+    """Per-user and global token buckets.
+
+    Buckets of idle users are evicted when there are more than max_users,
+    starting with the least recently seen.
+
+    Parameters
+    ----------
+    rate: float
+        Requests per second allowed to each user.
+
+    burst: int
+        Requests a user can make at once.
+
+    global_rate: float or None
+        Requests per second allowed to every user together.  None disables
+        the global limit.
+
+    global_burst: int or None
+        Requests every user together can make at once.  By default
+        global_rate.
+
+    max_users: int
+        Maximum number of user buckets kept in memory.
+    """
+
+    def __init__(self, rate, burst, global_rate=None, global_burst=None,
+                 max_users=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+
+        self.global_bucket = None
+        if(global_rate is not None):
+            self.global_bucket = TokenBucket(global_rate, global_burst or global_rate)
+
+        self.stats = {'allowed': 0, 'throttled_user': 0, 'throttled_global': 0}
+
+        self._buckets = collections.OrderedDict()  # user id -> TokenBucket
+        self._lock = threading.Lock()
+
+    def allow(self, user_id):
+        """Checks if a user can make a request now.
+
+        Returns
+        -------
+        allowed: bool
+            False if the request exceeds the user or the global limit.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if(bucket is None):
+                bucket = TokenBucket(self.rate, self.burst, now)
+                self._buckets[user_id] = bucket
+
+                while(len(self._buckets) > self.max_users):
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+
+            if(not bucket.consume(now=now)):
+                self.stats['throttled_user'] += 1
+                return False
+
+            if(self.global_bucket is not None and not self.global_bucket.consume(now=now)):
+                bucket.tokens += 1  # the user is not charged for it
+                self.stats['throttled_global'] += 1
+                return False
+
+            self.stats['allowed'] += 1
+            return True
+
+
+# --------------------------------------------------------------------------------
+# registry
+# --------------------------------------------------------------------------------
+limiters = {}  # name -> RateLimiter
+
+
+def throttle_stats():
+    """Counters of every rate limiter.
+
+    Returns
+    -------
+    stats: dict
+        allowed and throttled requests for each limiter.
+    """
+    return {name: dict(limiter.stats) for name, limiter in limiters.items()}
@@ -0,0 +1,343 @@
+"""Multi-process runtime that shards the updates by chat.
+
+One intake process receives the updates, by polling or with the webhook
+server, and sends each one to the worker process that owns its chat.  Every
+worker builds its own dispatcher with commands.setup and its own database
+pool, so the handlers of different chats run without sharing a GIL while
+the updates of each chat keep their order.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+
+# package imports
+from .executor import chat_id
+
+
+logger = logging.getLogger(__name__)
+
+_PUT_WAIT = 0.05  # longest wait on a queue holding the queues lock
+
+
+# --------------------------------------------------------------------------------
+# runtime
+# --------------------------------------------------------------------------------
+class ShardedRuntime:
+    """Pool of worker processes, each one owning the chats whose id hashes
+    to it.
+
+    A supervisor thread restarts the workers that die.  Every restarted
+    worker gets a new queue, since the dead one could hold the lock of the
+    old queue forever.  The updates that can still be read from the old
+    queue are moved to the new one, the rest are counted as stranded.  A
+    lock keeps submit from putting updates in a queue being replaced.
+
+    Parameters
+    ----------
+    workers: int
+        Number of worker processes.  Each one opens its own database pool,
+        so the database must accept workers times the pool size.
+
+    factory: callable
+        Module level function called once in every worker with the index
+        of the worker and the number of workers.  It returns a pair
+        (process, close): process is called with each update as a dict and
+        close, if not None, when the worker stops.  By default
+        telegram_processor.
+
+    maxsize: int
+        Maximum number of pending updates per worker.  submit blocks when
+        the queue of a worker is full.
+
+    check_interval: float
+        Seconds between two checks of the supervisor.
+    """
+
+    def __init__(self, workers=None, factory=None, maxsize=1000,
+                 check_interval=1.0):
+        self.workers = workers or os.cpu_count()
+        self.factory = factory or telegram_processor
+        self.check_interval = check_interval
+
+        self.maxsize = maxsize
+
+        self.stats = {'submitted': 0, 'busy': 0, 'restarts': 0, 'stranded': 0}
+
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue(maxsize) for _ in range(self.workers)]
+        self._processes = [None] * self.workers
+        self._ready = [None] * self.workers  # kept until the child opens it
+        self._queues_lock = threading.Lock()  # held to use or replace a queue
+        self._stopping = threading.Event()
+        self._supervisor = None
+
+    def start(self, timeout=60):
+        """Starts the workers and waits until every one is ready."""
+        events = [self._spawn(i) for i in range(self.workers)]
+
+        for i, event in enumerate(events):
+            if(not event.wait(timeout)):
+                raise RuntimeError(f'Worker {i} did not start in {timeout} s.')
+
+        self._supervisor = threading.Thread(target=self._supervise,
+                                            name='shard-supervisor', daemon=True)
+        self._supervisor.start()
+        logger.info('%d shard workers ready.', self.workers)
+
+    def submit(self, data, timeout=None):
+        """Sends an update to the worker that owns its chat.  It must be
+        called from a single intake thread to keep the order of each chat.
+
+        Parameters
+        ----------
+        data: dict
+            Update as decoded from the Telegram JSON.
+
+        timeout: float or None
+            Seconds to wait if the worker queue is full.
+
+        Raises
+        ------
+        queue.Full
+            If the queue is still full after timeout seconds.
+
+        ValueError
+            If data does not have the shape of an update.
+        """
+        index = self.worker(chat_id(data))
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        # the lock is only held for short waits, so the supervisor can
+        # replace the queue of a dead worker while submit waits for room
+        while(True):
+            wait = _PUT_WAIT
+            if(deadline is not None):
+                wait = min(wait, max(0, deadline - time.monotonic()))
+
+            with self._queues_lock:
+                try:
+                    self._queues[index].put(data, timeout=wait)
+                    break
+                except queue.Full:
+                    pass
+
+            if(deadline is not None and time.monotonic() >= deadline):
+                self.stats['busy'] += 1
+                raise queue.Full
+
+        self.stats['submitted'] += 1
+
+    def worker(self, key):
+        """Index of the worker that handles key."""
+        return zlib.crc32(str(key).encode()) % self.workers
+
+    def alive(self):
+        """Number of workers running."""
+        return sum(p is not None and p.is_alive() for p in self._processes)
+
+    def shutdown(self, wait=True, timeout=30):
+        """Handles every pending update and stops the workers.  The ones
+        that do not finish in timeout seconds are terminated."""
+        self._stopping.set()
+        if(self._supervisor is not None):
+            self._supervisor.join()
+
+        for q in self._queues:
+            q.put(None)
+
+        if(wait):
+            deadline = time.monotonic() + timeout
+            for process in self._processes:
+                process.join(max(0, deadline - time.monotonic()))
+                if(process.is_alive()):
+                    logger.warning('Terminating %s.', process.name)
+                    process.terminate()
+                    process.join()
+
+    def _spawn(self, index):
+        ready = self._context.Event()
+        process = self._context.Process(target=_worker_main,
+            args=(index, self.workers, self._queues[index], self.factory, ready),
+            name=f'shard-worker-{index}', daemon=True)
+        process.start()
+
+        self._processes[index] = process
+        self._ready[index] = ready
+        return ready
+
+    def _supervise(self):
+        while(not self._stopping.wait(self.check_interval)):
+            for i, process in enumerate(self._processes):
+                if(process.is_alive() or self._stopping.is_set()):
+                    continue
+
+                logger.error('%s died with exit code %s.  Restarting it.',
+                             process.name, process.exitcode)
+                self.stats['restarts'] += 1
+                self._replace_queue(i)
+                self._spawn(i)
+
+    def _replace_queue(self, index):
+        """Gives a new queue to a dead worker and moves to it the updates
+        that can be read from the old one."""
+        with self._queues_lock:
+            old = self._queues[index]
+            new = self._queues[index] = self._context.Queue(self.maxsize)
+
+            moved = lost = 0
+            while(True):
+                try:
+                    # a short wait lets the updates still buffered in this
+                    # process reach the pipe, without waiting forever for
+                    # the lock the dead worker may hold
+                    data = old.get(timeout=_PUT_WAIT)
+                except queue.Empty:
+                    break
+
+                try:
+                    new.put_nowait(data)
+                    moved += 1
+                except queue.Full:
+                    lost += 1
+
+            stranded = old.qsize() + lost
+            old.cancel_join_thread()
+            old.close()
+
+        if(stranded > 0):
+            self.stats['stranded'] += stranded
+            logger.error('%d updates of shard %d were stranded in its old queue.',
+                         stranded, index)
+        elif(moved > 0):
+            logger.info('Moved %d updates of shard %d to its new queue.', moved, index)
+
+
+def _worker_main(index, nworkers, q, factory, ready):
+    # the intake process decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    logging.basicConfig(level=logging.INFO,
+        format=f'%(asctime)s - shard {index} - %(name)s - %(levelname)s - %(message)s')
+
+    process, close = factory(index, nworkers)
+    ready.set()
+
+    try:
+        while(True):
+            data = q.get()
+            if(data is None):
+                break
+
+            try:
+                process(data)
+            except Exception:
+                logger.exception('Error while processing update %s.',
+                                 data.get('update_id'))
+    finally:
+        if(close is not None):
+            close()
+
+
+# --------------------------------------------------------------------------------
+# telegram worker
+# --------------------------------------------------------------------------------
+def telegram_processor(index, nworkers):
+    """Builds the dispatcher of a worker with the handlers of
+    xerta_bot.commands.
+
+    The outbox global rate (OUTBOX_GLOBAL_RATE) is split between the
+    workers, since the Telegram limit applies to the bot as a whole.  Each
+    worker serves its metrics on METRICS_PORT + 1 + index.  The usage
+    statistics are read again from the database every ANALYTICS_RELOAD_TTL
+    seconds, 30 by default, since every worker only sees its own commands.
+    """
+    global_rate = float(os.environ.get('OUTBOX_GLOBAL_RATE', 30))
+    os.environ['OUTBOX_GLOBAL_RATE'] = str(global_rate / nworkers)
+    os.environ['METRICS_PORT'] = str(int(os.environ.get('METRICS_PORT', 9108)) + 1 + index)
+    os.environ.setdefault('ANALYTICS_RELOAD_TTL', '30')
+
+    from telegram import Bot, Update
+    from telegram.ext import Dispatcher
+
+    # package imports
+    from . import commands, metrics
+    from .outbox import start_outbox, stop_outbox
+    from .database import manager
+    from .database.managers.commands import start_audit_writer, stop_audit_writer
+    from .database.managers.jokes import refresh_joke_ids
+
+    bot = Bot(os.environ['TOKEN'])
+    dp = Dispatcher(bot, None, workers=0, use_context=True)
+    commands.setup(dp)
+
+    with manager.connection() as conn:
+        refresh_joke_ids(conn)
+
+    start_audit_writer()
+    start_outbox(bot)
+    metrics.start_metrics_server()
+
+    def process(data):
+        dp.process_update(Update.de_json(data, bot))
+
+    def close():
+        stop_outbox()
+        stop_audit_writer()
+        metrics.stop_metrics_server()
+
+    return process, close
+
+
+# --------------------------------------------------------------------------------
+# intake
+# --------------------------------------------------------------------------------
+def poll(bot, runtime, stop, timeout=30, queue_timeout=None):
+    """Receives the updates with getUpdates and sends them to the workers
+    until stop is set.
+
+    Parameters
+    ----------
+    bot: telegram.Bot
+        Bot used to call getUpdates.
+
+    runtime: ShardedRuntime
+        Workers that handle the updates.
+
+    stop: threading.Event
+        Set it to stop polling.  It is checked after every long poll.
+
+    timeout: int
+        Seconds of each long poll.
+
+    queue_timeout: float or None
+        Seconds to wait if the queue of a worker is full.  None waits as
+        long as needed, which stops polling until the workers catch up.
+    """
+    offset = None
+
+    while(not stop.is_set()):
+        try:
+            updates = bot.get_updates(offset=offset, timeout=timeout)
+        except Exception:
+            logger.exception('Error while getting updates.')
+            time.sleep(1)
+            continue
+
+        for update in updates:
+            data = update.to_dict()
+            try:
+                chat_id(data)
+            except ValueError:
+                logger.warning('Skipped malformed update %s.', update.update_id)
+            else:
+                runtime.submit(data, timeout=queue_timeout)
+            offset = update.update_id + 1
+
+    # confirm the updates received so they are not sent again
+    if(offset is not None):
+        bot.get_updates(offset=offset, timeout=0)
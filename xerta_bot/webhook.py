@@ -0,0 +1,187 @@
+import hmac
+import http.server
+import json
+import logging
+import queue
+import threading
+
+# package imports
+from .executor import chat_id
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+# --------------------------------------------------------------------------------
+# webhook server
+# --------------------------------------------------------------------------------
+class WebhookServer:
+    """Local HTTP server that receives the updates sent by Telegram.
+
+    Every update is validated and queued in a ChatExecutor, whose workers
+    call process with the decoded JSON.  Updates of the same chat are
+    processed in the order they arrived.
+
+    Parameters
+    ----------
+    process: callable
+        Function called with the update as a dict.
+
+    executor: xerta_bot.executor.ChatExecutor
+        Worker pool with bounded queues.
+
+    secret_token: str or None
+        Value expected in the X-Telegram-Bot-Api-Secret-Token header.
+        Requests with another value are rejected.  None disables the check.
+
+    host: str
+        Interface to listen on.
+
+    port: int
+        Port to listen on.  0 picks a free port.
+
+    path: str
+        URL path that receives the updates.
+
+    queue_timeout: float
+        Seconds to wait for room in a full queue.  After that the request
+        is answered with 503 so Telegram sends it again later.
+
+    max_body: int
+        Maximum size in bytes of a request body.  Larger requests are
+        answered with 413 without reading them.
+    """
+
+    def __init__(self, process, executor, secret_token=None, host='127.0.0.1',
+                 port=8443, path='/webhook', queue_timeout=1, max_body=2**20):
+        self.process = process
+        self.executor = executor
+        self.secret_token = secret_token
+        self.path = path
+        self.queue_timeout = queue_timeout
+        self.max_body = max_body
+
+        self.stats = {'accepted': 0, 'rejected': 0, 'invalid': 0, 'busy': 0,
+                      'too_large': 0}
+        self._stats_lock = threading.Lock()
+
+        self._httpd = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.webhook = self
+        self._thread = None
+
+    @property
+    def address(self):
+        """(host, port) where the server is listening."""
+        return self._httpd.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name='webhook', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """Stops receiving updates and waits for the queued ones."""
+        if(self._thread is not None):
+            self._httpd.shutdown()  # it would wait forever if never started
+        self._httpd.server_close()
+        self.executor.shutdown(wait=True)
+
+    def receive(self, body, secret_token):
+        """Validates and queues an update.
+
+        Returns
+        -------
+        status: int
+            HTTP status code of the response.
+        """
+        if(not self.authorized(secret_token)):
+            return 403
+
+        return self._enqueue(body)
+
+    def authorized(self, secret_token):
+        """Checks the secret token of a request before its body is read."""
+        if(self.secret_token is not None and not hmac.compare_digest(
+                (secret_token or '').encode(), self.secret_token.encode())):
+            self._count('rejected')
+            return False
+
+        return True
+
+    def _enqueue(self, body):
+        try:
+            data = json.loads(body)
+            key = chat_id(data)
+        except ValueError:
+            self._count('invalid')
+            return 400
+
+        try:
+            self.executor.submit(key, self._process, data,
+                                 timeout=self.queue_timeout)
+        except queue.Full:
+            self._count('busy')
+            return 503
+
+        self._count('accepted')
+        return 200
+
+    def _process(self, data):
+        try:
+            self.process(data)
+        except Exception:
+            logger.exception('Error while processing update %s.',
+                             data.get('update_id'))
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        webhook = self.server.webhook
+
+        # the body is only read once the request is accepted.  Otherwise
+        # the connection is closed, so its bytes are never parsed as the
+        # next request.
+        if(self.path != webhook.path):
+            self._respond(404, close=True)
+            return
+
+        if(not webhook.authorized(self.headers.get(SECRET_HEADER))):
+            self._respond(403, close=True)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if(length < 0):
+                raise ValueError(length)
+        except ValueError:
+            webhook._count('invalid')
+            self._respond(400, close=True)
+            return
+
+        if(length > webhook.max_body):
+            webhook._count('too_large')
+            self._respond(413, close=True)
+            return
+
+        body = self.rfile.read(length)
+        self._respond(webhook._enqueue(body))
+
+    def _respond(self, status, close=False):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        if(close):
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
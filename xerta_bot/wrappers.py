@@ -1,14 +1,23 @@
+import functools
+import logging
 import os
 
+from . import metrics, ratelimit
+from .outbox import reply
 from .database import manager
-from .database.managers.commands import insert_command
-from .database.managers.users import get_users, insert_user
+from .database.managers.commands import record_command
+from .database.managers.users import has_privilege, insert_user
+
+
+logger = logging.getLogger(__name__)
 
 
 # --------------------------------------------------------------------------------
 # decorators
 # --------------------------------------------------------------------------------
 def public(func):
+    @metrics.timed('public')
+    @functools.wraps(func)
     def wrapper(update, context):
         user = update.message.from_user
         
@@ -18,42 +27,43 @@ def public(func):
         last_name = user.last_name
         language_code = user.language_code
             
-        conn = manager.connect()
-        insert_user(conn,
-            ['id', 'username', 'first_name', 'last_name', 'language_code'],
-            [user_id, username, first_name, last_name, language_code]
-        )
+        with manager.connection() as conn:
+            insert_user(conn,
+                ['id', 'username', 'first_name', 'last_name', 'language_code'],
+                [user_id, username, first_name, last_name, language_code]
+            )
 
-        func(update, context)
+            func(update, context)
     
     return wrapper
 
 
 def private(func):
+    @metrics.timed('private')
+    @functools.wraps(func)
     def wrapper(update, context):            
-        user_id = int(update.message.from_user.id)
+        user_id = int(update.effective_user.id)
         
-        conn = manager.connect()
-        df = get_users(conn, privilege=1).join(get_users(conn, privilege=2))
-        if(user_id in list(df['id'].values)):
-            func(update, context)
-        else:
-            update.message.reply_text('Sorry, this method is private.')
+        with manager.connection() as conn:
+            if(has_privilege(conn, user_id, 1, 2)):
+                func(update, context)
+            else:
+                reply(update, 'Sorry, this method is private.')
     
     return wrapper
 
 
 def restricted(func):
+    @metrics.timed('restricted')
+    @functools.wraps(func)
     def wrapper(update, context):            
-        user_id = int(update.message.from_user.id)
+        user_id = int(update.effective_user.id)
         
-        conn = manager.connect()
-        df = get_users(conn, privilege=2)
-
-        if(user_id in df['id'].values):
-            func(update, context)
-        else:
-            update.message.reply_text('Sorry, this method is restricted.')
+        with manager.connection() as conn:
+            if(has_privilege(conn, user_id, 2)):
+                func(update, context)
+            else:
+                reply(update, 'Sorry, this method is restricted.')
     
     return wrapper
 
@@ -62,12 +72,60 @@ def restricted(func):
 # command
 # --------------------------------------------------------------------------------
 def command(func):
+    @metrics.timed('command')
+    @functools.wraps(func)
     def wrapper(update, context):
         user_id = str(update.message.from_user.id)
         
-        conn = manager.connect()
-        insert_command(conn, user_id, func.__name__)
+        record_command(user_id, func.__name__)
         
         func(update, context)
     
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+# --------------------------------------------------------------------------------
+# rate limit
+# --------------------------------------------------------------------------------
+RATE_LIMIT = float(os.environ.get('RATE_LIMIT', 1))  # requests per second and user
+RATE_BURST = int(os.environ.get('RATE_BURST', 5))
+
+
+def throttled(rate=RATE_LIMIT, burst=RATE_BURST, global_rate=None,
+              global_burst=None):
+    """Drops the updates of users that exceed a rate limit.
+
+    It must be the outermost decorator after metrics.observed, so throttled
+    updates never reach the database.  Every decorated handler has its own
+    limiter, registered in ratelimit.limiters under the name of the handler.
+
+    Parameters
+    ----------
+    rate: float
+        Requests per second allowed to each user.
+
+    burst: int
+        Requests a user can make at once.
+
+    global_rate: float or None
+        Requests per second allowed to every user together.
+
+    global_burst: int or None
+        Requests every user together can make at once.
+    """
+    def decorator(func):
+        limiter = ratelimit.RateLimiter(rate, burst, global_rate, global_burst)
+        ratelimit.limiters[func.__name__] = limiter
+
+        @functools.wraps(func)
+        def wrapper(update, context):
+            user_id = update.effective_user.id
+
+            if(limiter.allow(user_id)):
+                func(update, context)
+            else:
+                logger.debug('Throttled %s from user %s.', func.__name__, user_id)
+
+        return wrapper
+
+    return decorator
\ No newline at end of file